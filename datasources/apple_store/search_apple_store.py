@@ -1,8 +1,11 @@
 import time
+import random
 import datetime
 import re
 import json
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from google_play_scraper.scraper import PlayStoreScraper
 from itunes_app_scraper.scraper import AppStoreScraper
@@ -559,7 +562,7 @@ class SearchAppleStore(Search):
             return data['data'][0]
 
 
-def collect_from_store(store, method, languages=None, countries=None, full_detail=False, params={}, log=print):
+def collect_from_store(store, method, languages=None, countries=None, full_detail=False, params={}, log=print, max_workers=1, rate_limiter=None, interrupted=None, progress=None):
     """
     Collect data from Apple or Google store using https://github.com/digitalmethodsinitiative/itunes-app-scraper
     or https://github.com/digitalmethodsinitiative/google-play-scraper
@@ -568,258 +571,318 @@ def collect_from_store(store, method, languages=None, countries=None, full_detai
     :param method: 'app', 'list', 'search', 'developer', 'similar', 'permissions'
     :param params: parameters for the method
     :param log: log function
+    :param int max_workers: number of query/language/country combinations to collect concurrently
+    :param rate_limiter: object with a blocking wait() method called before each request; share one between workers
+                         (and datasets) to cap the request rate regardless of max_workers
+    :param interrupted: callable returning True if collection should stop
+    :param progress: callable receiving the number of finished and total combinations after each one finishes
     """
+    interrupted = interrupted or (lambda: False)
+
+    def check_interrupted():
+        if interrupted():
+            raise ProcessorInterruptedException(f"Interrupted while collecting from the {store} store")
+
+    def throttle():
+        check_interrupted()
+        if rate_limiter is not None:
+            rate_limiter.wait()
+
     dynamic_app_detail_args = {} # TODO Set below for apple store, but unsure if there is a default
 
-    scraper = None
+    scraper_class = None
     if store == 'apple':
-        scraper = AppStoreScraper()
+        scraper_class = AppStoreScraper
         # Get parameters according to itunes_app_scraper
         # Still have to map the keyword in /web/src/store/method.ts
         if params.get('collection', None):
             params['collection'] = getattr(AppStoreCollections, params.get('collection'))
         dynamic_app_detail_args = {'add_ratings':True}
     elif store == 'google':
-        scraper = PlayStoreScraper()
+        scraper_class = PlayStoreScraper
         if params.get('collection', None):
             params['collection'] = getattr(PlayStoreCollections, params.get('collection'))
     else:
         raise Exception("Unknown store: {}".format(store))
 
-    languages = [lang.strip() for lang in languages] if languages else []
-    countries = [country.strip() for country in countries] if countries else []
-    result = []
-    done = 0
+    # Scrapers are not shared between threads; each worker creates its own
+    scrapers = threading.local()
 
-    if method == 'app':
-        ids = [id.strip() for id in params.get('appId', '')]
+    def get_scraper():
+        if not hasattr(scrapers, "scraper"):
+            scrapers.scraper = scraper_class()
+        return scrapers.scraper
 
-        count = len(ids) * len(languages) * len(countries)
+    # The same app can turn up for several queries; its details are only requested once per country and language
+    app_details = {}
+    app_details_lock = threading.Lock()
 
-        for id in ids:
-            for language in languages:
-                for country in countries:
-                    values = {
-                        'app_id': id,
-                        'country': country,
-                        'short': params.get('short'),
-                    }
+    def collect_app_details(apps, **kwargs):
+        """
+        Collect full details for a list of app IDs, spreading them over
+        the worker threads that are not busy with other combinations
+        """
+        apps = list(apps)
+        locale = (kwargs.get("country"), kwargs.get("lang"))
+        with app_details_lock:
+            missing = [app for app in dict.fromkeys(apps) if (app, *locale) not in app_details]
 
-                    if store == 'google':
-                        values["lang"] = language
+        def get_details(app):
+            throttle()
+            return list(get_scraper().get_multiple_app_details([app], **kwargs, **dynamic_app_detail_args))
 
-                    args = {k: v for k, v in values.items() if v is not None}
-                    export_args = {k: v for k, v in args.items() if k not in ("short")}
+        if detail_workers <= 1 or len(missing) <= 1:
+            details = {app: get_details(app) for app in missing}
+        else:
+            details = {}
+            with ThreadPoolExecutor(max_workers=min(detail_workers, len(missing))) as executor:
+                futures = {executor.submit(get_details, app): app for app in missing}
+                try:
+                    for future in as_completed(futures):
+                        details[futures[future]] = future.result()
+                finally:
+                    # Do not start on the rest if one failed or the dataset was interrupted
+                    for future in futures:
+                        future.cancel()
 
-                    try:
-                        app = scraper.get_app_details(**args, **dynamic_app_detail_args)
-                        result.append({**export_args, **app})
+        with app_details_lock:
+            app_details.update({(app, *locale): app_detail for app, app_detail in details.items()})
+            return [app_detail for app in apps for app_detail in app_details[(app, *locale)]]
 
-                        done += 1
-                        log(f"Collected {done} of {count} apps")
-                        time.sleep(1) # avoid throttling
+    languages = [lang.strip() for lang in languages] if languages else []
+    countries = [country.strip() for country in countries] if countries else []
 
-                    except (PlayStoreException, AppStoreException) as e:
-                        # collection cannot be loaded. Probably due to invalid
-                        # query, so no error, just assume no result
-                        done += 1
-                        log(f"Error collecting app {id}: {e}")
+    if method == 'app':
+        ids = [id.strip() for id in params.get('appId', '')]
+        # The Apple store is not queried per language, so each app only needs to be requested once per country
+        request_languages = languages if store == 'google' else languages[:1]
+        tasks = [(id, language, country) for id in ids for language in request_languages for country in countries]
+
+        def collect(id, language, country):
+            values = {
+                'app_id': id,
+                'country': country,
+                'short': params.get('short'),
+            }
 
-        return result
+            if store == 'google':
+                values["lang"] = language
 
-    elif method == 'list':
+            args = {k: v for k, v in values.items() if v is not None}
+            export_args = {k: v for k, v in args.items() if k not in ("short")}
 
-        count = len(languages) * len(countries)
+            app = get_scraper().get_app_details(**args, **dynamic_app_detail_args)
+            time.sleep(1) # avoid throttling
+            return [{**export_args, **app}]
 
-        for language in languages:
-            for country in countries:
-                values = {
-                    'collection': params.get('collection'),
-                    'category': params.get('category'),
-                    'age': params.get('age'),
-                    'num': params.get('num'),
-                    'country': country
-                }
+        # collection cannot be loaded. Probably due to invalid
+        # query, so no error, just assume no result
+        describe_error = lambda id, language, country: f"Error collecting app {id}"
+        unit = "apps"
 
-                if store == 'google':
-                    values['lang'] = language
+    elif method == 'list':
+        request_languages = languages if store == 'google' else languages[:1]
+        tasks = [(None, language, country) for language in request_languages for country in countries]
+
+        def collect(id, language, country):
+            values = {
+                'collection': params.get('collection'),
+                'category': params.get('category'),
+                'age': params.get('age'),
+                'num': params.get('num'),
+                'country': country
+            }
 
-                args = {k: v for k, v in values.items() if v is not None}
-                export_args = {k: v for k, v in args.items() if k not in ("num")}
+            if store == 'google':
+                values['lang'] = language
 
-                try:
-                    apps = scraper.get_app_ids_for_collection(**args)
+            args = {k: v for k, v in values.items() if v is not None}
+            export_args = {k: v for k, v in args.items() if k not in ("num")}
 
-                    if full_detail:
-                        apps = scraper.get_multiple_app_details(apps, country=country, **dynamic_app_detail_args)
-                    else:
-                        apps = [{"id": id} for id in apps]
+            apps = get_scraper().get_app_ids_for_collection(**args)
 
-                    for app in apps:
-                        result.append({**export_args, **app})
+            if full_detail:
+                apps = collect_app_details(apps, country=country)
+            else:
+                apps = [{"id": id} for id in apps]
 
-                    done += 1
-                    log(f"Collected {done} of {count} apps")
+            return [{**export_args, **app} for app in apps]
 
-                except (PlayStoreException, AppStoreException) as e:
-                    # collection cannot be loaded. Probably due to invalid
-                    # query, so no error, just assume 0 results
-                    done += 1
-                    log(f"Error collecting collection {params.get('collection')}: {e}")
-                    
-        return result
+        # collection cannot be loaded. Probably due to invalid
+        # query, so no error, just assume 0 results
+        describe_error = lambda id, language, country: f"Error collecting collection {params.get('collection')}"
+        unit = "apps"
 
     elif method == 'search':
         queries = [query.strip() for query in params.get('queries', [])]
+        tasks = [(query, language, country) for query in queries for language in languages for country in countries]
+
+        def collect(query, language, country):
+            values = {
+                'term': query,
+                'num': params.get('num'),
+                'page': params.get('page'),
+                'country': country,
+                'lang': language,
+            }
+            args = {k: v for k, v in values.items() if v is not None}
+            export_args = {k: v for k, v in args.items() if k not in ("num", "page")}
 
-        count = len(queries) * len(languages) * len(countries)
-
-        for query in queries:
-            for language in languages:
-                for country in countries:
-                    values = {
-                        'term': query,
-                        'num': params.get('num'),
-                        'page': params.get('page'),
-                        'country': country,
-                        'lang': language,
-                    }
-                    args = {k: v for k, v in values.items() if v is not None}
-                    export_args = {k: v for k, v in args.items() if k not in ("num", "page")}
-
-                    try:
-                        apps = scraper.get_app_ids_for_query(**args)
-                        if full_detail:
-                            apps = scraper.get_multiple_app_details(apps, country=country, lang=language, **dynamic_app_detail_args)
-                        else:
-                            apps = [{"id": id} for id in apps]
-
-                        for app in apps:
-                            result.append({**export_args, **app})
-                            
-                        done += 1
-                        log(f"Collected {done} of {count} queries")
-
-                    except (PlayStoreException, AppStoreException) as e:
-                        # search results cannot be parsed, probably due to
-                        # lack of results, i.e. faulty query or 0 hits
-                        done += 1
-                        log(f"Error collecting query {query}: {e}")
-
-        return result
-    
-    elif method == 'developer':
-        ids = [id.strip() for id in params.get('devId', [])]
+            apps = get_scraper().get_app_ids_for_query(**args)
+            if full_detail:
+                apps = collect_app_details(apps, country=country, lang=language)
+            else:
+                apps = [{"id": id} for id in apps]
 
-        count = len(ids) * len(languages) * len(countries)
+            return [{**export_args, **app} for app in apps]
 
-        for id in ids:
-            for language in languages:
-                for country in countries:
-                    values = {
-                        'developer_id': id,
-                        'country': country,
-                    }
+        # search results cannot be parsed, probably due to
+        # lack of results, i.e. faulty query or 0 hits
+        describe_error = lambda query, language, country: f"Error collecting query {query}"
+        unit = "queries"
 
-                    if store == 'google':
-                        values['lang'] = params.get('lang')
-                        values['num'] = params.get('num')
+    elif method == 'developer':
+        ids = [id.strip() for id in params.get('devId', [])]
+        # Developer pages are not requested per language, so each developer only needs to be requested once per country
+        tasks = [(id, language, country) for id in ids for language in languages[:1] for country in countries]
 
-                    args = {k: v for k, v in values.items() if v is not None}
-                    export_args = {k: v for k, v in args.items() if k not in ("num")}
+        def collect(id, language, country):
+            values = {
+                'developer_id': id,
+                'country': country,
+            }
 
-                    try:
-                        apps = scraper.get_app_ids_for_developer(**args)
+            if store == 'google':
+                values['lang'] = params.get('lang')
+                values['num'] = params.get('num')
 
-                        if full_detail:
-                            apps = scraper.get_multiple_app_details(apps, country=country, **dynamic_app_detail_args)
-                        else:
-                            apps = [{"id": id} for id in apps]
+            args = {k: v for k, v in values.items() if v is not None}
+            export_args = {k: v for k, v in args.items() if k not in ("num")}
 
-                        for app in apps:
-                            result.append({**export_args, **app})
+            apps = get_scraper().get_app_ids_for_developer(**args)
 
-                        done += 1
-                        log(f"Collected {done} of {count} queries")
+            if full_detail:
+                apps = collect_app_details(apps, country=country)
+            else:
+                apps = [{"id": id} for id in apps]
 
-                    except (PlayStoreException, AppStoreException) as e:
-                        # no apps for developer, probably because of
-                        # faulty developer ID or wrong language/country
-                        done += 1
-                        log(f"Error collecting developer {id}: {e}")
+            return [{**export_args, **app} for app in apps]
 
-        return result
+        # no apps for developer, probably because of
+        # faulty developer ID or wrong language/country
+        describe_error = lambda id, language, country: f"Error collecting developer {id}"
+        unit = "queries"
 
     elif method == 'similar':
         ids = [id.strip() for id in params.get('appId', [])]
+        tasks = [(id, language, country) for id in ids for language in languages for country in countries]
 
-        count = len(ids) * len(languages) * len(countries)
-
-        for id in ids:
-            for language in languages:
-                for country in countries:
-                    values = {
-                        'app_id': id,
-                        'country': country,
-                        'lang': language,
-                    }
-                    args = {k: v for k, v in values.items() if v is not None}
-                    export_args = {k: v for k, v in args.items() if k not in ("app_id")}
-                    export_args = {"similar_to": id, **export_args}
-
-                    try:
-                        apps = scraper.get_similar_app_ids_for_app(**args)
+        def collect(id, language, country):
+            values = {
+                'app_id': id,
+                'country': country,
+                'lang': language,
+            }
+            args = {k: v for k, v in values.items() if v is not None}
+            export_args = {k: v for k, v in args.items() if k not in ("app_id")}
+            export_args = {"similar_to": id, **export_args}
 
-                        if full_detail:
-                            apps = scraper.get_multiple_app_details(apps, country=country, lang=language, **dynamic_app_detail_args)
-                        else:
-                            apps = [{"id": id} for id in apps]
+            apps = get_scraper().get_similar_app_ids_for_app(**args)
 
-                        for app in apps:
-                            result.append({**export_args, **app})
-                            
-                        done += 1
-                        log(f"Collected {done} of {count} apps")
+            if full_detail:
+                apps = collect_app_details(apps, country=country, lang=language)
+            else:
+                apps = [{"id": id} for id in apps]
 
-                    except (PlayStoreException, AppStoreException) as e:
-                        # no similar apps, probably because app did not
-                        # exist or other parameters were faulty
-                        done += 1
-                        log(f"Error collecting similar apps for app {id}: {e}")
+            return [{**export_args, **app} for app in apps]
 
-        return result
+        # no similar apps, probably because app did not
+        # exist or other parameters were faulty
+        describe_error = lambda id, language, country: f"Error collecting similar apps for app {id}"
+        unit = "apps"
 
     elif method == 'permissions':
         ids = [id.strip() for id in params.get('appId', [])]
+        tasks = [(id, language, None) for id in ids for language in languages]
 
-        count = len(ids) * len(languages) * len(countries)
+        def collect(id, language, country):
+            values = {
+                'app_id': id,
+                'lang': language,
+                'short': params.get('short'),
+            }
+            args = {k: v for k, v in values.items() if v is not None}
+            export_args = {k: v for k, v in args.items() if k not in ("short")}
 
-        for id in ids:
-            for language in languages:
-                values = {
-                    'app_id': id,
-                    'lang': language,
-                    'short': params.get('short'),
-                }
-                args = {k: v for k, v in values.items() if v is not None}
-                export_args = {k: v for k, v in args.items() if k not in ("short")}
+            permissions = get_scraper().get_permissions_for_app(**args)
 
-                try:
-                    permissions = scraper.get_permissions_for_app(**args)
+            return [{**export_args, "permission": permission} for permission in permissions]
 
-                    for permission in permissions:
-                        result.append({**export_args, "permission": permission})
+        # no permissions for app, probably because of
+        # faulty app ID or wrong language/country
+        describe_error = lambda id, language, country: f"Error collecting permissions for app {id}"
+        unit = "apps"
 
-                    done += 1
-                    log(f"Collected {done} of {count} apps")
+    else:
+        return None
 
-                except (PlayStoreException) as e:
-                    # no permissions for app, probably because of
-                    # faulty app ID or wrong language/country
-                    done += 1
-                    log(f"Error collecting permissions for app {id}: {e}")
+    def collect_task(task, max_attempts=5):
+        for attempt in range(1, max_attempts + 1):
+            throttle()
+            try:
+                return collect(*task), None
+            except (PlayStoreException, AppStoreException) as e:
+                return [], e
+            except requests.RequestException as e:
+                # Connection problems and rate limits are usually temporary; back off and try again
+                if attempt == max_attempts:
+                    return [], e
+                retry_after = e.response.headers.get("Retry-After") if e.response is not None else None
+                if retry_after and retry_after.isdigit():
+                    delay = min(30, int(retry_after))
+                else:
+                    delay = min(30, 2 ** attempt) + random.uniform(0, 1)
+                log(f"{describe_error(*task)} (attempt {attempt} of {max_attempts}), retrying in {delay:.0f} seconds: {e}")
+                # Wait in short steps so an interrupted dataset does not have to sit out the whole delay
+                wait_until = time.monotonic() + delay
+                while time.monotonic() < wait_until:
+                    check_interrupted()
+                    time.sleep(min(1, wait_until - time.monotonic()))
+
+    # Full details are collected in parallel only with workers left over from the combinations themselves
+    detail_workers = max(1, max_workers // max(1, len(tasks)))
+
+    count = len(tasks)
+    collected = [([], None)] * count
+
+    def task_finished(index, done):
+        apps, error = collected[index]
+        if error:
+            log(f"{describe_error(*tasks[index])}: {error}")
+        else:
+            log(f"Collected {done} of {count} {unit}")
+        if progress:
+            progress(done, count)
+
+    if max_workers > 1 and count > 1:
+        # Requests are I/O bound; collect several combinations at once, reporting each as it finishes
+        with ThreadPoolExecutor(max_workers=min(max_workers, count)) as executor:
+            futures = {executor.submit(collect_task, task): index for index, task in enumerate(tasks)}
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    check_interrupted()
+                    collected[futures[future]] = future.result()
+                    task_finished(futures[future], done)
+            finally:
+                for future in futures:
+                    future.cancel()
+    else:
+        for index, task in enumerate(tasks):
+            collected[index] = collect_task(task)
+            task_finished(index, index + 1)
 
-        return result
+    # Results are kept in the original order of the combinations
+    return [app for apps, error in collected for app in apps]
 
 
 def convert_screenshot(image_obj, c="w", f="jpeg"):
@@ -1,8 +1,10 @@
 import time
 import datetime
 import re
-import json
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from bs4 import BeautifulSoup
 from common.config_manager import config
 
@@ -12,6 +14,13 @@ from common.lib.exceptions import ProcessorInterruptedException, ProcessorExcept
 from common.lib.item_mapping import MappedItem
 from common.lib.user_input import UserInput
 from common.lib.helpers import url_to_hash
+from extensions.web_studies.selenium_scraper import RateLimiter
+
+try:
+    # orjson is considerably faster for the large JSON blob embedded in Azure Store pages
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 
 class SearchAzureStore(Search):
@@ -28,6 +37,13 @@ class SearchAzureStore(Search):
 
     base_url = "https://azuremarketplace.microsoft.com"
 
+    # Shared between all requests to the Azure Store
+    rate_limiter = RateLimiter(rate=8)
+    session = None
+    session_lock = threading.Lock()
+    # Responses with these status codes are usually temporary and are retried
+    retry_status_codes = (429, 500, 502, 503, 504)
+
     config = {
         "cache.azure.categories": {
             "type": UserInput.OPTION_TEXT_JSON,
@@ -128,6 +144,7 @@ class SearchAzureStore(Search):
                 sub_category = category.split("_--_")[1]
 
         count = 0
+        last_status_update = 0.0
         for query in queries:
             self.dataset.update_status(f"Processing query {query}")
             if self.interrupted:
@@ -135,15 +152,16 @@ class SearchAzureStore(Search):
             page = 1
             query_results = 0
             while True:
-                results = self.get_query_results(query, category=main_category, sub_category=sub_category, previous_results=query_results, page=page)
-                if not results:
-                    self.dataset.update_status(f"No additional results found for query {query}")
-                    break
+                if self.interrupted:
+                    raise ProcessorInterruptedException(f"Processor interrupted while fetching query {query}")
 
-                for result in results:
+                page_results = 0
+                for result in self.get_query_results(query, category=main_category, sub_category=sub_category, previous_results=query_results, page=page):
+                    page_results += 1
                     if full_details:
-                        if self.interrupted:
+                        if query_results & 7 == 0 and self.interrupted:
                             # Only interrupting if we are collecting full details as otherwise we have already collected everything
+                            # Checked every 8 results; pages are also checked before they are requested
                             raise ProcessorInterruptedException(f"Processor interrupted while fetching details for {result.get('title')}")
 
                         if query_results >= max_results:
@@ -156,9 +174,16 @@ class SearchAzureStore(Search):
                     count += 1
                     query_results += 1
 
-                    self.dataset.update_status(f"Processed {query_results}{' of ' + str(max_results) if max_results > 0 else ''} for query {query}")
-                    if max_results > 0:
-                        self.dataset.update_progress(query_results / (max_results * len(queries)))
+                    # Status updates are written to the database; only update every 10 results or half a second
+                    if query_results % 10 == 0 or time.monotonic() - last_status_update > 0.5:
+                        self.dataset.update_status(f"Processed {query_results}{' of ' + str(max_results) if max_results > 0 else ''} for query {query}")
+                        if max_results > 0:
+                            self.dataset.update_progress(query_results / (max_results * len(queries)))
+                        last_status_update = time.monotonic()
+
+                if not page_results:
+                    self.dataset.update_status(f"No additional results found for query {query}")
+                    break
 
                 if query_results >= max_results:
                     # We may have extra result as results are batched
@@ -166,13 +191,53 @@ class SearchAzureStore(Search):
 
                 page += 1
 
+    def request_get(self, url, params=None, max_attempts=4):
+        """
+        GET request to the Azure Store
+
+        Uses a session that retries connection errors, and retries rate limited (429) and server error responses
+        itself: waiting for the Retry-After header (capped at 30 seconds) or with exponential backoff, and stopping
+        if the dataset is interrupted. Rate limited across all requests.
+
+        :param str url:  URL to request
+        :param dict params:  Query parameters
+        :param int max_attempts:  Number of times to request the URL if the response status is a transient error
+        :return requests.Response:  Response; may have a non-200 status code if retries were exhausted
+        """
+        if SearchAzureStore.session is None:
+            with SearchAzureStore.session_lock:
+                if SearchAzureStore.session is None:
+                    # Status codes are retried below, where the wait can be capped and interrupted
+                    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[], respect_retry_after_header=False,
+                                    raise_on_status=False)
+                    session = requests.Session()
+                    session.mount("https://", HTTPAdapter(max_retries=retries))
+                    session.mount("http://", HTTPAdapter(max_retries=retries))
+                    SearchAzureStore.session = session
+
+        for attempt in range(1, max_attempts + 1):
+            self.rate_limiter.wait()
+            response = self.session.get(url, params=params, timeout=30)
+            if response.status_code not in self.retry_status_codes or attempt == max_attempts:
+                return response
+
+            retry_after = response.headers.get("Retry-After", "")
+            delay = min(30, int(retry_after) if retry_after.isdigit() else 0.5 * 2 ** attempt)
+            self.dataset.log(f"Azure Store responded with status {response.status_code} for {url}; retrying in {delay:.0f} seconds")
+            # Wait in short steps so an interrupted dataset does not have to sit out the whole delay
+            wait_until = time.monotonic() + delay
+            while time.monotonic() < wait_until:
+                if self.interrupted:
+                    raise ProcessorInterruptedException("Interrupted while waiting to retry Azure Store request")
+                time.sleep(min(1, wait_until - time.monotonic()))
+
     def get_app_details(self, app):
         """
         Collect full details for an app
         """
         app_url = self.base_url + app["href"]
         try:
-            response = requests.get(app_url, timeout=30)
+            response = self.request_get(app_url)
         except requests.exceptions.RequestException as e:
             self.dataset.log(f"Failed to fetch details for app {app.get('title')} from Azure Store: {e}")
             return app
@@ -225,7 +290,7 @@ class SearchAzureStore(Search):
             else:
                 # Request other tab
                 try:
-                    tab_request = requests.get(self.base_url + tab.get("href"), timeout=30)
+                    tab_request = self.request_get(self.base_url + tab.get("href"))
                 except requests.exceptions.RequestException as e:
                     self.dataset.log(
                         f"Failed to fetch additional tab {tab_label} for app {app_title} from Azure Store: {e}")
@@ -247,6 +312,8 @@ class SearchAzureStore(Search):
     def get_query_results(self, query, category=None, sub_category=None, previous_results=0, page=1, store="en-us"):
         """
         Fetch query results from Azure Store
+
+        Generator; results are parsed from the page as they are consumed.
         """
         query_url = self.base_url + f"/{store}/marketplace/apps"
         if category:
@@ -261,7 +328,7 @@ class SearchAzureStore(Search):
             params["subcategories"] = sub_category
 
         try:
-            response = requests.get(query_url, params, timeout=30)
+            response = self.request_get(query_url, params)
         except requests.exceptions.RequestException as e:
             raise ProcessorException(f"Failed to fetch data from Azure Store: {e}")
         if response.status_code != 200:
@@ -270,12 +337,12 @@ class SearchAzureStore(Search):
         soup = BeautifulSoup(response.content, "html.parser")
         results = soup.find_all("div", attrs={"class": "spza_tileWrapper"})
 
-        return [{
-            "title": soup.find("div", attrs={"class": "tileContent"}).get_text(),
-            "href": soup.find("a").get("href"),
-            "rank": i+previous_results,
-            "source": str(soup),
-            } for i, soup in enumerate(results, start=1)]
+        for i, tile in enumerate(results, start=1):
+            yield {
+                "title": tile.find("div", attrs={"class": "tileContent"}).get_text(),
+                "href": tile.find("a").get("href"),
+                "rank": i + previous_results,
+            }
 
     @staticmethod
     def validate_query(query, request, user):
@@ -352,8 +419,9 @@ class SearchAzureStore(Search):
         # JSON object is stored in a script tag
         scripts = soup.find_all("script")
         for script in scripts:
-            if "window.__INITIAL_STATE__" in str(script):
-                return json.loads(str(script).split("window.__INITIAL_STATE__ =")[1].rstrip("</script>").strip())
+            script_text = script.string
+            if script_text and "window.__INITIAL_STATE__ =" in script_text:
+                return json_loads(script_text.split("window.__INITIAL_STATE__ =", 1)[1].strip())
         return None
 
 
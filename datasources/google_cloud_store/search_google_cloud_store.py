@@ -1,19 +1,39 @@
 from datetime import datetime
-import urllib
+import re
+import urllib.parse
 import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.expected_conditions import staleness_of
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException, JavascriptException
 
-from extensions.web_studies.selenium_scraper import SeleniumSearch, SeleniumWrapper
+from extensions.web_studies.selenium_scraper import SeleniumSearch, SeleniumWrapper, SeleniumDriverPool
 from backend.lib.worker import BasicWorker
-from common.lib.exceptions import ProcessorInterruptedException, ProcessorException
+from backend.lib.search import Search
+from common.lib.exceptions import ProcessorInterruptedException, ProcessorException, QueryParametersException
 from common.lib.item_mapping import MappedItem
 from common.lib.user_input import UserInput
 from common.config_manager import config
 from common.lib.helpers import url_to_hash
 
+# Browsers are shared between Google Cloud Marketplace searches and the category collector
+# Only text and links are collected, so images and fonts are not loaded, and pages are used as soon as the DOM is ready
+driver_pool = SeleniumDriverPool(size=2, eager=True, disable_media=True)
+
+
+def quick_wait(driver, timeout=5):
+    """
+    WebDriverWait that polls every 100ms (instead of 500ms) and ignores elements going stale while polling
+
+    Marketplace pages render quickly once loaded, so most waits are resolved well within the default interval.
+    """
+    return WebDriverWait(driver, timeout, poll_frequency=0.1, ignored_exceptions=(StaleElementReferenceException,))
+
+
 class SearchGoogleCloudStore(SeleniumSearch):
     """
     Search Google Cloud Product Store data source
@@ -27,6 +47,68 @@ class SearchGoogleCloudStore(SeleniumSearch):
     is_static = False  # Whether this datasource is still updated
 
     base_url = "https://console.cloud.google.com/marketplace"
+    # Marketplace in English; elements are found by their English names
+    listing_url = base_url + "?" + urllib.parse.urlencode({"hl": "en"})
+
+    # Locators (for the webdriver) and CSS selectors (for collect_results_script) of result page elements per method
+    result_identifiers = {
+        "categories": {
+            "total": (By.CLASS_NAME, "cfc-shelf-header"),
+            "blocks": (By.TAG_NAME, "cfc-result-card"),
+            "selectors": {
+                "block": "cfc-result-card",
+                "title": "[role='heading']",
+                "sub_title": ".cfc-result-card-subtitle",
+                "description": ".cfc-result-card-description",
+            },
+        },
+        "search": {
+            "total": (By.TAG_NAME, "h1"),
+            "blocks": (By.TAG_NAME, "mp-search-results-list-item"),
+            "selectors": {
+                "block": "mp-search-results-list-item",
+                "title": "h3",
+                "sub_title": "h4",
+                "description": "p",
+            },
+        },
+    }
+    next_button_identifier = (By.CLASS_NAME, "cfc-table-pagination-nav-button-next")
+    # Results per page
+    page_size = 40
+    # Total number of results in the results header, e.g. "1,234 results"
+    results_count_regex = re.compile(r"(\d[\d,]*)\s*results")
+
+    # Collects all fields of every result block on the page in a single round trip to the browser
+    collect_results_script = """
+    const [method, selectors, includeHtml] = arguments;
+    const getText = (element) => element ? element.innerText.trim() : null;
+    return Array.from(document.querySelectorAll(selectors.block)).map(block => {
+        const subTitle = block.querySelector(selectors.sub_title);
+        const link = block.querySelector("a");
+        const thumbnail = block.querySelector("img");
+        let subTitleText = getText(subTitle);
+        let typeText = null;
+        if (method === "categories") {
+            const typeLabel = Array.from(block.querySelectorAll("dt")).find(dt => dt.textContent.includes("Type "));
+            typeText = typeLabel ? getText(typeLabel.parentElement.querySelector("dd")) : null;
+        } else if (subTitle) {
+            typeText = getText(subTitle.querySelector("span"));
+            if (typeText) {
+                subTitleText = subTitleText.replace(typeText, "");
+            }
+        }
+        return {
+            "title": getText(block.querySelector(selectors.title)),
+            "subtitle": subTitleText,
+            "link": link ? link.href : null,
+            "description": getText(block.querySelector(selectors.description)),
+            "type": typeText,
+            "thumbnail": thumbnail ? thumbnail.src : null,
+            "html": includeHtml ? block.outerHTML : null
+        };
+    });
+    """
 
     # Categories are collected and cached
     config = {
@@ -42,11 +124,38 @@ class SearchGoogleCloudStore(SeleniumSearch):
             "help": "Google Cloud Product Categories Updated At",
             "tooltip": "automatically updated",
             "default": 0,
-            "coerce_type": float,
+            "coerce_type": int,
+            "indirect": True
+        },
+        "google_cloud.max_browsers": {
+            "type": UserInput.OPTION_TEXT,
+            "help": "Browsers per dataset",
+            "default": 2,
+            "coerce_type": int,
+            "tooltip": "Number of queries or categories collected in parallel (each with its own browser) for a Google "
+                       "Cloud Marketplace dataset",
+        },
+        "cache.google_cloud.category_results": {
+            "type": UserInput.OPTION_TEXT_JSON,
+            "help": "Google Cloud Product Category Results",
+            "tooltip": "automatically updated; recently collected results (without HTML) per category",
+            "default": {},
             "indirect": True
         }
     }
 
+    # Collected category results are reused for this many seconds
+    category_cache_ttl = 6 * 60 * 60
+    # The cache is stored as a setting, so it is kept small: at most this many results in total, for the most
+    # recently collected categories
+    category_cache_max_results = 2000
+
+    # Formatted category options for get_options(), the categories_updated_at value they were built from and when
+    # that value was last checked
+    category_options = None
+    category_options_updated_at = None
+    category_options_checked_at = 0
+
     @classmethod
     def get_options(cls, parent_dataset=None, user=None):
         max_results = 1000
@@ -84,6 +193,20 @@ class SearchGoogleCloudStore(SeleniumSearch):
                 "max": max_results,
                 "tooltip": "The Google Cloud marketplace returns apps in batches of 40."
             },
+            "force_rescrape": {
+                "type": UserInput.OPTION_TOGGLE,
+                "help": "Ignore recently collected results",
+                "default": False,
+                "tooltip": "Categories collected in the last six hours are otherwise not collected again.",
+                "requires": "method^=categories",
+            },
+            "include_html": {
+                "type": UserInput.OPTION_TOGGLE,
+                "help": "Include HTML",
+                "default": False,
+                "tooltip": "Include the HTML of each result in the collected data. This can considerably increase the "
+                           "size of the dataset.",
+            },
             # "full_details": {
             #     "type": UserInput.OPTION_TOGGLE,
             #     "help": "Include full application details",
@@ -91,10 +214,18 @@ class SearchGoogleCloudStore(SeleniumSearch):
             #     "tooltip": "If enabled, the full details of each application will be included in the output.",
             # },
         }
-        categories = config.get("cache.google_cloud.categories", {})
-        if categories:
-            formatted_categories = {k: categories[k]["name"] for k in sorted(categories)}
-            options["categories"]["options"] = formatted_categories
+        # Sorted category options are only rebuilt when the categories have been updated, which is checked at most
+        # once per minute
+        if cls.category_options is None or time.monotonic() - cls.category_options_checked_at > 60:
+            categories_updated_at = config.get("cache.google_cloud.categories_updated_at", 0)
+            if cls.category_options is None or cls.category_options_updated_at != categories_updated_at:
+                categories = config.get("cache.google_cloud.categories", {})
+                cls.category_options = {k: categories[k]["name"] for k in sorted(categories)}
+                cls.category_options_updated_at = categories_updated_at
+            cls.category_options_checked_at = time.monotonic()
+
+        if cls.category_options:
+            options["categories"]["options"] = cls.category_options
             options["categories"]["type"] = UserInput.OPTION_MULTI_SELECT
             options["categories"]["default"] = []
         else:
@@ -102,10 +233,33 @@ class SearchGoogleCloudStore(SeleniumSearch):
         
         return options
 
+    def search(self, query):
+        """
+        Search for items matching the given query
+
+        Unlike other Selenium searches, no browser is started here; each query borrows one from the driver pool in
+        get_items() so that queries can be collected in parallel.
+
+        :param dict query:  Query parameters
+        :return:  Iterable of matching items, or None if there are no results.
+        """
+        if not self.is_selenium_available():
+            raise ProcessorException("Selenium not available; please ensure browser and webdriver are installed and configured in settings")
+
+        return Search.search(self, query)
+
+    def quit_selenium(self):
+        """
+        Return browser to the driver pool, if one was borrowed
+        """
+        driver_pool.give_back(self)
+
     def get_items(self, query):
         """
         Fetch items from Google Cloud Product Store
 
+        Queries (or categories) are collected in parallel, each with a browser borrowed from the driver pool.
+
         :param query:
         :return:
         """
@@ -116,58 +270,186 @@ class SearchGoogleCloudStore(SeleniumSearch):
         method = query.get("method")
         queries = query.get("query", []) + query.get("categories", [])
         max_results = self.parameters.get("amount", 40)
+        force_rescrape = self.parameters.get("force_rescrape", False)
+        include_html = self.parameters.get("include_html", False)
+        cached_results = self.config.get("cache.google_cloud.category_results", {}) if method == "categories" else {}
+        known_categories = self.config.get("cache.google_cloud.categories", {}) if method == "categories" else {}
 
         # Identifiers depend on method
-        if method == "categories":
-            result_total_identifier = (By.CLASS_NAME, "cfc-shelf-header")
-            result_blocks_identifier = (By.TAG_NAME, "cfc-result-card")
-            title_identifier = (By.XPATH, ".//*[@role='heading']")
-            sub_title_identifier = (By.CLASS_NAME, "cfc-result-card-subtitle")
-            description_identifier = (By.CLASS_NAME, "cfc-result-card-description")
-        elif method == "search":
-            result_total_identifier = (By.TAG_NAME, "h1")
-            result_blocks_identifier = (By.TAG_NAME, "mp-search-results-list-item")
-            title_identifier = (By.TAG_NAME, "h3")
-            sub_title_identifier = (By.TAG_NAME, "h4")
-            description_identifier = (By.TAG_NAME, "p")
-        else:
+        identifiers = self.result_identifiers.get(method)
+        if identifiers is None:
             raise ProcessorException("Invalid method")
 
+        # Use recently collected results where possible and collect the rest
+        to_collect = []
         for query in queries:
-            if self.interrupted:
-                raise ProcessorInterruptedException("Interrupted while collecting Google Cloud Store queries")
-
-            collected = 0
             if method == "categories":
-                known_categories = self.config.get("cache.google_cloud.categories", {})
+                category_key = query
                 current_category = known_categories.get(query, {})
                 query = current_category.get("name")
                 url = current_category.get("link")
+
+                cached = cached_results.get(category_key)
+                # HTML is not cached, so datasets that include it always collect anew
+                if not force_rescrape and not include_html and cached and \
+                        time.time() - cached["updated_at"] < self.category_cache_ttl and cached["amount"] >= max_results:
+                    self.dataset.update_status(f"Using results for {query} collected in the last {self.category_cache_ttl // 3600} hours")
+                    for item in cached["results"][:max_results]:
+                        # Results cached before HTML was excluded may still include it
+                        item.pop("html", None)
+                        yield item
+                    continue
             elif method == "search":
+                category_key = None
                 url = f"{SearchGoogleCloudStore.base_url}/browse?q={urllib.parse.quote_plus(query)}"
             else:
                 raise ProcessorException("Invalid method")
 
-            self.dataset.update_status(f"Processing query {query}")
+            to_collect.append((category_key, query, url))
+
+        if not to_collect:
+            return
+
+        self.dataset.update_status(f"Collecting {len(to_collect)} queries from Google Cloud Marketplace")
+        collected = 0
+        done = 0
+        failed = 0
+        last_status_update = time.monotonic()
+        max_browsers = max(1, self.config.get("google_cloud.max_browsers", 2))
+        # Each worker thread keeps its browser for all queries it collects; returned to the pool when done
+        self.worker_browsers = threading.local()
+        self.borrowed_browsers = []
+        try:
+            with ThreadPoolExecutor(max_workers=min(max_browsers, len(to_collect))) as executor:
+                futures = {executor.submit(self.collect_query, method, query, url, max_results, identifiers, include_html): (category_key, query)
+                           for category_key, query, url in to_collect}
+                try:
+                    for future in as_completed(futures):
+                        if self.interrupted:
+                            raise ProcessorInterruptedException("Interrupted while collecting Google Cloud Store queries")
+
+                        category_key, query = futures[future]
+                        done += 1
+                        try:
+                            query_results, results_count, complete = future.result()
+                        except ProcessorException as e:
+                            failed += 1
+                            self.dataset.log(f"Unable to collect query {query} from Google Cloud Store: {e}")
+                            self.dataset.update_status(f"Unable to collect query {query}")
+                            continue
+
+                        if results_count is not None:
+                            self.dataset.log(f"Found {results_count} total results for {query}")
+
+                        for item in query_results:
+                            collected += 1
+                            yield item
+                            # Status updates are database writes; keep them to every 25 results or two seconds
+                            if collected % 25 == 0 or time.monotonic() - last_status_update > 2:
+                                self.dataset.update_status(f"Collected {collected} results")
+                                last_status_update = time.monotonic()
+                        self.dataset.update_progress(done / len(to_collect))
+
+                        if category_key is not None and complete:
+                            # Cache results (without HTML) for other datasets; expired categories are dropped, as
+                            # are the oldest ones once the cache holds category_cache_max_results results
+                            now = int(time.time())
+                            cached_results = {key: cached for key, cached in
+                                              self.config.get("cache.google_cloud.category_results", {}).items()
+                                              if now - cached["updated_at"] < self.category_cache_ttl}
+                            cached_results[category_key] = {"updated_at": now, "amount": max_results, "results": [
+                                {key: value for key, value in item.items() if key != "html"} for item in query_results]}
+
+                            kept_results = {}
+                            num_cached = 0
+                            for key, cached in sorted(cached_results.items(), key=lambda cached: cached[1]["updated_at"], reverse=True):
+                                num_cached += len(cached["results"])
+                                if num_cached > self.category_cache_max_results:
+                                    break
+                                kept_results[key] = cached
+                            self.config.set("cache.google_cloud.category_results", kept_results)
+                finally:
+                    # Do not start any queries still waiting when interrupted
+                    for future in futures:
+                        future.cancel()
+        finally:
+            for selenium_helper in self.borrowed_browsers:
+                driver_pool.give_back(selenium_helper)
+
+        self.dataset.update_status(f"Collected {collected} results")
+        if failed:
+            self.dataset.update_status(f"Unable to collect {failed} of {len(to_collect)} queries from Google Cloud Store; see dataset log for details", is_final=True)
+
+    @contextmanager
+    def worker_browser(self, clear_cookies=False):
+        """
+        Browser for the current worker thread
+
+        Borrowed from the driver pool on first use and kept for all following queries collected by the same thread;
+        get_items() returns them to the pool when done. The browser is discarded if anything but a ProcessorException
+        is raised while it is in use.
+
+        :param bool clear_cookies:  Delete cookies if the browser was used before
+        :return SeleniumWrapper:  Wrapper with a running driver
+        """
+        selenium_helper = getattr(self.worker_browsers, "selenium_helper", None)
+        if selenium_helper is None:
+            selenium_helper = SeleniumWrapper()
+            driver_pool.borrow(selenium_helper)
+            selenium_helper.set_page_load_timeout()
+            # Only explicit waits are used; find_elements should return immediately if nothing is found
+            selenium_helper.driver.implicitly_wait(0)
+            self.worker_browsers.selenium_helper = selenium_helper
+            self.borrowed_browsers.append(selenium_helper)
+        elif clear_cookies:
+            selenium_helper.driver.delete_all_cookies()
+
+        try:
+            yield selenium_helper
+        except ProcessorException:
+            raise
+        except Exception:
+            driver_pool.give_back(selenium_helper, discard=True)
+            self.worker_browsers.selenium_helper = None
+            raise
+
+    def collect_query(self, method, query, url, max_results, identifiers, include_html=False):
+        """
+        Collect results for a single query or category
+
+        Runs in a worker thread with that thread's browser, so the dataset is not updated here; failures are raised as
+        ProcessorExceptions instead.
+
+        :param str method:  Query method ("categories" or "search")
+        :param str query:  Query or category name
+        :param str url:  URL of the first page of results
+        :param int max_results:  Number of results to collect
+        :param dict identifiers:  Locators and selectors for the result page elements
+        :param bool include_html:  Include the HTML of each result
+        :return tuple:  List of collected items, total number of results reported (or None), and whether collection
+                        completed
+        """
+        result_total_identifier = identifiers["total"]
+        result_blocks_identifier = identifiers["blocks"]
+        # Cookies are cleared between searches but kept when browsing categories
+        with self.worker_browser(clear_cookies=method == "search") as selenium_helper:
+            driver = selenium_helper.driver
 
-            success, errors = self.get_with_error_handling(url)
+            success, errors = selenium_helper.get_with_error_handling(url)
             if not success:
-                self.dataset.log(f"Failed to fetch Google Cloud Store: {errors}")
-                self.dataset.update_status("Unable to connect to Google Cloud Store.", is_final=True)
-                return
-
-            # Ensure page is loaded
-            if not self.check_page_is_loaded():
-                self.dataset.update_status("Google Cloud Store did not load after 60 seconds; try again later.",
-                                           is_final=True)
-                return
-            self.scroll_down_page_to_load(60)
-            collected_at = datetime.now()
+                raise ProcessorException(f"Unable to connect to Google Cloud Store: {errors}")
+
+            # Pages are loaded eagerly; wait for the results to be rendered rather than for the page to fully load
+            if not selenium_helper.wait_for_selector(identifiers["selectors"]["block"], max_time=30):
+                raise ProcessorException("No results loaded after 30 seconds; try again later.")
+            # Scroll only if results still need to be lazy loaded
+            selenium_helper.scroll_down_page_to_load(60, target_count=min(max_results, self.page_size),
+                                                     locator=result_blocks_identifier)
+            collected_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
             # Get total results
             try:
-                WebDriverWait(self.driver, 5).until(EC.presence_of_element_located(result_total_identifier))
-                results_header = self.driver.find_elements(*result_total_identifier)
+                results_header = quick_wait(driver).until(EC.presence_of_all_elements_located(result_total_identifier))
             except TimeoutException:
                 results_header = None
             if not results_header:
@@ -175,83 +457,75 @@ class SearchGoogleCloudStore(SeleniumSearch):
                 self.log.warning(f"Unable to parse Google Cloud results; page format may have changed")
                 results_count = None
             else:
-                results_count = results_header[0].text.replace(' results', '').replace(",", "")
-                self.dataset.log(f"Found {results_count} total results for {query}")
-                try:
-                    results_count = int(results_count)
-                except ValueError:
-                    results_count = None
+                results_count_match = self.results_count_regex.search(results_header[0].text)
+                results_count = int(results_count_match.group(1).replace(",", "")) if results_count_match else None
 
             # Collect product search result blocks
-            WebDriverWait(self.driver, 5).until(EC.presence_of_element_located(result_blocks_identifier))
-            results = self.driver.find_elements(*result_blocks_identifier)
+            try:
+                results = quick_wait(driver).until(EC.presence_of_all_elements_located(result_blocks_identifier))
+            except TimeoutException:
+                results = None
             if not results:
                 self.log.warning(f"Unable to parse results for query {query}")
-                self.dataset.update_status("No results found", is_final=True)
-                return
+                raise ProcessorException("No results found")
 
-            while collected < max_results:
-                for i, result in enumerate(results):
+            collected = []
+            complete = False
+            while len(collected) < max_results:
+                # Read all result blocks at once rather than querying each element via the webdriver
+                try:
+                    products = driver.execute_script(self.collect_results_script, method, identifiers["selectors"], include_html)
+                except JavascriptException as e:
+                    raise ProcessorException(f"Unable to read results; page format may have changed ({e.msg})")
+                for product in products:
                     if self.interrupted:
                         raise ProcessorInterruptedException("Interrupted while collecting Google Cloud Store results")
 
-                    collected += 1
-                    title_block = result.find_elements(*title_identifier)
-                    product_link_block = result.find_elements(By.XPATH, ".//a")
-                    sub_title_block = result.find_elements(*sub_title_identifier)
-                    description_block = result.find_elements(*description_identifier)
-                    thumb_block = result.find_elements(By.XPATH, ".//img")
-
-                    if method == "categories":
-                        type_block = result.find_elements(By.XPATH, ".//dt[contains(text(), 'Type ')]/../dd")
-                        sub_title_text = sub_title_block[0].text if sub_title_block else None
-                    elif method == "search":
-                        if sub_title_block:
-                            type_block = sub_title_block[0].find_elements(By.TAG_NAME, "span")
-                            if type_block:
-                                sub_title_text = sub_title_block[0].text.replace(type_block[0].text, "") if sub_title_block else None
-                        else:
-                            type_block = None
-                            sub_title_text = None
-
-                    yield {
-                        "collected_at": collected_at.strftime("%Y-%m-%d %H:%M:%S"),
+                    item = {
+                        "collected_at": collected_at,
                         "query": query,
-                        "rank": collected,
-                        "title": title_block[0].text if title_block else None,
-                        "subtitle": sub_title_text,
-                        "link": product_link_block[0].get_attribute("href") if product_link_block else None,
-                        "description": description_block[0].text if description_block else None,
-                        "type": type_block[0].text if type_block else None,
-                        "thumbnail": thumb_block[0].get_attribute("src") if thumb_block else None,
-                        "html": result.get_attribute("outerHTML")
+                        "rank": len(collected) + 1,
+                        "title": product["title"],
+                        "subtitle": product["subtitle"],
+                        "link": product["link"],
+                        "description": product["description"],
+                        "type": product["type"],
+                        "thumbnail": product["thumbnail"],
                     }
-                    self.dataset.update_status(f"Collected {collected} results")
+                    if include_html:
+                        item["html"] = product["html"]
+                    collected.append(item)
 
-                if collected >= max_results or (results_count and collected >= results_count):
+                if len(collected) >= max_results or (results_count and len(collected) >= results_count):
+                    complete = True
                     break
 
+                # Only the first block is needed to detect the page change
+                previous_first_result = results[0]
+
                 # Check if there are more results
                 # Note: could also use "page=" in URL though not actual URL query param
-                next_button = self.driver.find_elements(By.CLASS_NAME, "cfc-table-pagination-nav-button-next")
+                next_button = driver.find_elements(*self.next_button_identifier)
                 if not next_button:
-                    self.log.warning(f"Google Cloud page may have changed; unable to find next button")
-                    self.dataset.update_status(f"Unable to continue to next page for query {query}")
+                    self.log.warning(f"Google Cloud page may have changed; unable to find next button for query {query}")
                     break
                 # Click next button
                 next_button[0].click()
-                # Ensure old results are gone
-                WebDriverWait(self.driver, 5).until(staleness_of(results[0]))
-                # Wait for new results
-                WebDriverWait(self.driver, 5).until(EC.presence_of_element_located(result_blocks_identifier))
+                # Wait until the old results are gone and the new results are present
+                try:
+                    results = quick_wait(driver).until(
+                        lambda driver: staleness_of(previous_first_result)(driver) and
+                                       EC.presence_of_all_elements_located(result_blocks_identifier)(driver))
+                except TimeoutException:
+                    results = None
                 # Update collected time
-                collected_at = datetime.now()
-                results = self.driver.find_elements(*result_blocks_identifier)
+                collected_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 if not results:
-                    self.log.warning(f"Unable to parse results for query {query}")
-                    self.dataset.update_status(f"Unable to continue to next page for query {query}")
+                    self.log.warning(f"Unable to parse results for page of query {query}")
                     break
 
+        return collected, results_count, complete
+
     def get_app_details(self, app):
         """
         Collect full details for an app
@@ -280,11 +554,11 @@ class SearchGoogleCloudStore(SeleniumSearch):
             if not categories:
                 raise QueryParametersException("No category selected")
         elif method == "search":
+            # Strip, drop empty queries and remove duplicates (keeping order)
             queries = query.get("query", "")
-            if not queries.strip():
+            queries = list(dict.fromkeys(q.strip() for q in queries.replace("\n", ",").split(",") if q.strip()))
+            if not queries:
                 raise QueryParametersException("No search query provided")
-
-            queries = queries.replace("\n", ",").split(",")
         else:
             raise ProcessorException("Invalid method")
            
@@ -293,6 +567,8 @@ class SearchGoogleCloudStore(SeleniumSearch):
             "categories": categories,
             "query": queries,
             "amount": int(query.get("amount", 40)),
+            "force_rescrape": bool(query.get("force_rescrape", False)),
+            "include_html": bool(query.get("include_html", False)),
         }
 
 
@@ -308,7 +584,7 @@ class SearchGoogleCloudStore(SeleniumSearch):
         item["body"] = item["description"]
         item["timestamp"] = item["collected_at"]
         # Removing HTML; can be accessed via original item if desired
-        item.pop("html")
+        item.pop("html", None)
         return MappedItem(item)
 
 
@@ -320,47 +596,61 @@ class GoogleCloudStoreCategories(BasicWorker):
 
     # Run every day to update categories
     ensure_job = {"remote_id": "google-cloud-store-category-collector", "interval": 86400}
-
-    cat_filter_xpath = "//cfc-unfold[.//span[contains(text(), 'Category')]]"
+    # ...but only collect categories again if they were last checked this many seconds ago
+    refresh_interval = 7 * 86400
+
+    # Returns the text and link of each category filter or null if the category filter box has not (yet) loaded
+    cat_filter_script = """
+    const catBox = Array.from(document.querySelectorAll("cfc-unfold")).find(
+        unfold => Array.from(unfold.querySelectorAll("span")).some(span => span.textContent.includes("Category")));
+    return catBox ? Array.from(catBox.querySelectorAll("a")).map(link => [link.textContent, link.href]) : null;
+    """
 
     def work(self):
         """
         Collect Google Cloud Product Store categories and store them in database via Selenium
         """
+        # Categories rarely change; no need to start a browser if they were checked recently
+        known_categories = config.get("cache.google_cloud.categories", {})
+        if known_categories and time.time() - config.get("cache.google_cloud.categories_updated_at", 0) < self.refresh_interval:
+            self.log.info("Google Cloud Marketplace categories were checked recently; not collecting")
+            return
+
         # using English as we are searching for components by their English names
-        params = {"hl": "en"}
-        categories_url = SearchGoogleCloudStore.base_url + ("?" + urllib.parse.urlencode(params)) if params else ""
-        selenium_helper = SeleniumWrapper()
-        if not selenium_helper.is_selenium_available():
+        categories_url = SearchGoogleCloudStore.listing_url
+        if not SeleniumWrapper.is_selenium_available():
             raise ProcessorException("Selenium is not available; cannot collect categories from Google Cloud Store")
 
         # Backend runs get_options for each processor on init; but does not seem to have logging
-        selenium_helper.selenium_log.info(f"Fetching category options from Google Cloud Marketplace {categories_url}")
+        SeleniumWrapper.selenium_log.info(f"Fetching category options from Google Cloud Marketplace {categories_url}")
 
-        selenium_helper.start_selenium()
-        selenium_helper.driver.get(categories_url)
-        if not selenium_helper.check_for_movement():
-            raise ProcessorException("Failed to load Google Cloud Marketplace")
+        # Driver is returned to the pool (or quit if anything went wrong) when done
+        with driver_pool.acquire() as selenium_helper:
+            # Only explicit waits are used
+            selenium_helper.driver.implicitly_wait(0)
+            selenium_helper.driver.get(categories_url)
+            if not selenium_helper.check_for_movement():
+                raise ProcessorException("Failed to load Google Cloud Marketplace")
 
-        if not selenium_helper.check_page_is_loaded():
-            raise ProcessorException("Google Cloud Marketplace did not load and timed out")
+            if not selenium_helper.wait_for_page_load():
+                raise ProcessorException("Google Cloud Marketplace did not load and timed out")
 
-        selenium_helper.scroll_down_page_to_load(60)
+            selenium_helper.scroll_down_page_to_load(60)
 
-        try:
-            category_filters = self.get_category_filters(selenium_helper.driver)
-            if category_filters:
-                self.log.info(f"Collected category options ({len(category_filters)}) from Google Cloud Marketplace")
-                config.set("cache.google_cloud.categories", category_filters)
-                config.set("cache.google_cloud.categories_updated_at", datetime.now().timestamp())
-            else:
-                self.log.warning("Failed to collect category options from Google Cloud Marketplace")
+            try:
+                category_filters = self.get_category_filters(selenium_helper.driver)
+                if category_filters:
+                    self.log.info(f"Collected category options ({len(category_filters)}) from Google Cloud Marketplace")
+                    if category_filters != known_categories:
+                        config.set("cache.google_cloud.categories", category_filters)
+                        # Rebuild options in this process straight away
+                        SearchGoogleCloudStore.category_options = None
+                    config.set("cache.google_cloud.categories_updated_at", int(time.time()))
+                else:
+                    self.log.warning("Failed to collect category options from Google Cloud Marketplace")
 
-        except ProcessorException as e:
-            self.log.error(f"Error collecting Google Cloud Store categories: {e}")
-        finally:
-            # Always quit selenium
-            selenium_helper.quit_selenium()
+            except ProcessorException as e:
+                self.log.error(f"Error collecting Google Cloud Store categories: {e}")
 
 
         return
@@ -370,20 +660,25 @@ class GoogleCloudStoreCategories(BasicWorker):
         """
         Get category filters from Google Cloud Store
         """
-        # Get Category options
-        WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.XPATH, GoogleCloudStoreCategories.cat_filter_xpath)))
-        possible_cat_boxes = driver.find_elements(By.XPATH, GoogleCloudStoreCategories.cat_filter_xpath)
-        if not possible_cat_boxes:
+        # Get Category options; text and links are read in the browser in one go
+        def find_category_links(driver):
+            # The wait only stops on a truthy value; wrap the links so an empty list (no categories) counts as found,
+            # while null (no category box yet) keeps waiting
+            cat_links = driver.execute_script(GoogleCloudStoreCategories.cat_filter_script)
+            return (cat_links,) if cat_links is not None else False
+
+        try:
+            cat_links, = quick_wait(driver).until(find_category_links)
+        except TimeoutException:
             raise ProcessorException("Failed to find category options")
 
-        cat_box = possible_cat_boxes[0]
         category_filters = {}
-        for link in cat_box.find_elements(By.CSS_SELECTOR, "a"):
-            cat_name = driver.execute_script("return arguments[0].textContent", link).split("(")[0] # remove extra text (i.e., (num of items))
+        for link_text, link_href in cat_links:
+            cat_name = link_text.split("(")[0] # remove extra text (i.e., (num of items))
             if cat_name:
                 category_filters[cat_name.replace(" ", "_").lower()] = {
                     "name": cat_name,
-                    "link": link.get_attribute("href")
+                    "link": link_href
                 }
 
         return category_filters
\ No newline at end of file
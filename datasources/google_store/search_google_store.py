@@ -1,9 +1,15 @@
 import re
+import time
 import datetime
 
 from common.lib.item_mapping import MappedItem
 from common.lib.user_input import UserInput
+from common.config_manager import config
 from extensions.web_studies.datasources.apple_store.search_apple_store import SearchAppleStore, collect_from_store
+from extensions.web_studies.selenium_scraper import RateLimiter
+
+# Queries, languages and countries can be separated by commas or newlines
+query_separator = re.compile(r"[,\n]")
 
 
 class SearchGoogleStore(SearchAppleStore):
@@ -21,6 +27,64 @@ class SearchGoogleStore(SearchAppleStore):
     is_local = False  # Whether this datasource is locally scraped
     is_static = False  # Whether this datasource is still updated
 
+    config = {
+        "google_store.max_workers": {
+            "type": UserInput.OPTION_TEXT,
+            "help": "Parallel requests per dataset",
+            "default": 4,
+            "coerce_type": int,
+            "tooltip": "Number of query, language and country combinations collected from the Google Play Store at "
+                       "the same time for a dataset",
+        },
+    }
+
+    # Shared between all workers (and datasets), so the request rate does not grow with google_store.max_workers
+    rate_limiter = RateLimiter(rate=4)
+
+    # collect_from_store parameter the queries are passed as, per method; all other methods take app IDs
+    method_query_params = {
+        "search": "queries",
+        "developer": "devId",
+    }
+
+    # Map expected fields which may be missing and rename as desired
+    mapped_fields = {
+        "country": "query_country",
+        "lang": "query_language",
+        "title": "title",
+        "link": "link",
+        "4cat_developer_id": "developer_id",
+        "developer_name": "developer_name",
+        "developer_link": "developer_link",
+        "price_inapp": "price_inapp",
+        "category": "category",
+        "video_link": "video_link",
+        "icon_link": "icon_link",
+        "num_downloads_approx": "num_downloads_approx",
+        "num_downloads": "num_downloads",
+        "published_date": "published_date",
+        "published_timestamp": "published_timestamp",
+        "pegi": "pegi",
+        "pegi_detail": "pegi_detail",
+        "os": "os",
+        "rating": "rating",
+        "description": "description",
+        "price": "price",
+        "num_of_reviews": "num_of_reviews",
+        "developer_email": "developer_email",
+        "developer_address": "developer_address",
+        "developer_website": "developer_website",
+        "developer_privacy_policy_link": "developer_privacy_policy_link",
+        "data_safety_list": "data_safety_list",
+        "updated_on": "updated_on",
+        "app_version": "app_version",
+        "list_of_categories": "list_of_categories",
+        "errors": "errors",
+        "collected_at_timestamp": "collected_at_timestamp",
+    }
+    # Fields not included in additional_data_in_ndjson
+    mapped_keys = frozenset(mapped_fields) | {"app_id"}
+
     @classmethod
     def get_options(cls, parent_dataset=None, user=None):
 
@@ -82,33 +146,30 @@ class SearchGoogleStore(SearchAppleStore):
         :param query:
         :return:
         """
-        queries = re.split(',|\n', self.parameters.get('query', ''))
         # Updated method from options to match the method names in the collect_from_store function
         method = self.option_to_method.get(self.parameters.get('method'))
         if method is None:
             self.log.warning(f"Google store unknown query method; check option_to_method dictionary matches method options.")
+            self.dataset.update_status(f"Unknown query method {self.parameters.get('method')}; unable to collect from Google Store", is_final=True)
+            return
 
-        params = {}
-        if method == 'search':
-            params['queries'] = queries
-        elif method == 'developer':
-            params['devId'] = queries
-        elif method == 'similar':
-            params['appId'] = queries
-        elif method == 'permissions':
-            params['appId'] = queries
-        else:
-            params['appId'] = queries
+        queries = query_separator.split(self.parameters.get('query', ''))
+        params = {self.method_query_params.get(method, "appId"): queries}
+
+        def report_progress(done, count):
+            self.dataset.update_status(f"Collected {done} of {count} query, language and country combinations from Google Store")
+            self.dataset.update_progress(done / count)
 
         self.dataset.log(f"Collecting {method} from Google Store")
-        results = collect_from_store('google', method, languages=re.split(',|\n', self.parameters.get('languages')), countries=re.split(',|\n', self.parameters.get('countries')), full_detail=self.parameters.get('full_details', False), params=params, log=self.dataset.log)
+        results = collect_from_store('google', method, languages=query_separator.split(self.parameters.get('languages')), countries=query_separator.split(self.parameters.get('countries')), full_detail=self.parameters.get('full_details', False), params=params, log=self.dataset.log, max_workers=max(1, config.get("google_store.max_workers", 4)), rate_limiter=self.rate_limiter, interrupted=lambda: self.interrupted, progress=report_progress)
         if results:
             self.dataset.log(f"Collected {len(results)} results from Google Store")
-            return [{"query_method": method, "collected_at_timestamp": datetime.datetime.now().timestamp(), "item_index": i, **result} for i, result in enumerate(results)]
+            envelope = {"query_method": method, "collected_at_timestamp": time.time()}
+            for i, result in enumerate(results):
+                yield {**envelope, "item_index": i, **result}
         else:
             self.dataset.log(
                 f"No results identified for {self.parameters.get('query', '') if method != 'lists' else self.parameters.get('collection')} from Google Play Store")
-            return []
 
     @staticmethod
     def map_item(item):
@@ -152,53 +213,40 @@ class SearchGoogleStore(SearchAppleStore):
         formatted_item["app_id"] = item.get("id", "")
         if "developer_link" in item:
             item["4cat_developer_id"] = item["developer_link"].split("dev?id=")[-1]
-        # Map expected fields which may be missing and rename as desired
-        mapped_fields = {
-            "country": "query_country",
-            "lang": "query_language",
-            "title": "title",
-            "link": "link",
-            "4cat_developer_id": "developer_id",
-            "developer_name": "developer_name",
-            "developer_link": "developer_link",
-            "price_inapp": "price_inapp",
-            "category": "category",
-            "video_link": "video_link",
-            "icon_link": "icon_link",
-            "num_downloads_approx": "num_downloads_approx",
-            "num_downloads": "num_downloads",
-            "published_date": "published_date",
-            "published_timestamp": "published_timestamp",
-            "pegi": "pegi",
-            "pegi_detail": "pegi_detail",
-            "os": "os",
-            "rating": "rating",
-            "description": "description",
-            "price": "price",
-            "num_of_reviews": "num_of_reviews",
-            "developer_email": "developer_email",
-            "developer_address": "developer_address",
-            "developer_website": "developer_website",
-            "developer_privacy_policy_link": "developer_privacy_policy_link",
-            "data_safety_list": "data_safety_list",
-            "updated_on": "updated_on",
-            "app_version": "app_version",
-            "list_of_categories": "list_of_categories",
-            "errors": "errors",
-            "collected_at_timestamp": "collected_at_timestamp",
-        }
-        for field in mapped_fields:
-            formatted_item[mapped_fields[field]] = item.get(field, "")
+        formatted_item.update({target: item.get(field, "") for field, target in SearchGoogleStore.mapped_fields.items()})
 
         # Add any additional fields to the item
         formatted_item["additional_data_in_ndjson"] = ", ".join(
-            [f"{key}: {value}" for key, value in item.items() if key not in list(mapped_fields) +  ["app_id"]])
+            f"{key}: {value}" for key, value in item.items() if key not in SearchGoogleStore.mapped_keys)
 
         # 4CAT required fields
         formatted_item["thread_id"] = ""
         formatted_item["author"] = item.get("developer_name", "")
         formatted_item["body"] = body
-        # some queries do not return a publishing timestamp so we use the collected at timestamp
-        formatted_item["timestamp"] = datetime.datetime.fromtimestamp(item.get("published_timestamp")) if "published_timestamp" in item else datetime.datetime.strptime(item.get("published_date"), "%Y-%m-%d") if "published_date" in item else item.get("collected_at_timestamp")
+        formatted_item["timestamp"] = SearchGoogleStore.get_item_timestamp(item)
+
+        return MappedItem(formatted_item)
 
-        return MappedItem(formatted_item)
\ No newline at end of file
+    @staticmethod
+    def get_item_timestamp(item):
+        """
+        Get the publishing time of an app
+
+        Some queries do not return a publishing timestamp (or date) so we use
+        the collected at timestamp instead.
+
+        :param dict item:  Item as collected from the store
+        :return:  Publishing datetime, or collected at timestamp
+        """
+        published_timestamp = item.get("published_timestamp")
+        if published_timestamp is not None:
+            return datetime.datetime.fromtimestamp(published_timestamp)
+
+        published_date = item.get("published_date")
+        if published_date:
+            try:
+                return datetime.datetime.fromisoformat(published_date)
+            except ValueError:
+                pass
+
+        return item.get("collected_at_timestamp")
@@ -4,12 +4,16 @@ Selenium Webpage HTML Scraper
 Currently designed around Firefox, but can also work with Chrome; results may vary
 """
 from urllib.parse import urlparse
-import datetime
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
 import random
+import threading
+import time
 from ural import is_url
 
 from common.config_manager import config
-from extensions.web_studies.selenium_scraper import SeleniumSearch
+from extensions.web_studies.selenium_scraper import SeleniumSearch, SeleniumWrapper
 from common.lib.exceptions import QueryParametersException, ProcessorInterruptedException
 from common.lib.item_mapping import MappedItem
 from common.lib.user_input import UserInput
@@ -25,6 +29,20 @@ class SearchWithSelenium(SeleniumSearch):
     description = "Query a list of urls to scrape HTML source code"  # description displayed in UI
     extension = "ndjson"
 
+    # Number of parsed page sources kept to reuse for identical pages
+    parsed_pages_cache_size = 256
+
+    config = {
+        "url_scraper.max_browsers": {
+            "type": UserInput.OPTION_TEXT,
+            "help": "Browsers per dataset",
+            "default": 2,
+            "coerce_type": int,
+            "tooltip": "Number of urls collected in parallel (each with its own browser) for a Selenium Url Collector "
+                       "dataset",
+        },
+    }
+
     @classmethod
     def get_options(cls, parent_dataset=None, user=None):
         options = {
@@ -63,32 +81,111 @@ class SearchWithSelenium(SeleniumSearch):
         """
         Separate and check urls, then loop through each and collects the HTML.
 
+        Urls (and their subpages) are collected in parallel, each worker thread with its own browser.
+
         :param query:
         :return:
         """
         self.dataset.log('Query: %s' % str(query))
         self.dataset.log('Parameters: %s' % str(self.parameters))
         scrape_additional_subpages = self.parameters.get("subpages", 0)
-        urls_to_scrape = [{'url':url, 'base_url':url, 'num_additional_subpages': scrape_additional_subpages, 'subpage_links':[]} for url in query.get('urls')]
+        # Duplicate urls are only scraped once
+        urls = list(dict.fromkeys(query.get('urls')))
 
-        # Do not scrape the same site twice
-        scraped_urls = set()
-        num_urls = len(urls_to_scrape)
+        # Do not scrape the same site twice; provided urls are not picked as subpages of other urls either
+        self.scraped_urls = set(urls)
+        self.scraped_urls_lock = threading.Lock()
+        num_urls = len(urls)
         if scrape_additional_subpages:
             num_urls = num_urls * (scrape_additional_subpages + 1)
 
+        # The browser started by search() is used by the first worker; other workers start their own
+        self.worker_browsers = threading.local()
+        self.worker_browsers_lock = threading.Lock()
+        self.extra_browsers = []
+        self.own_browser_in_use = False
+        max_browsers = max(1, config.get("url_scraper.max_browsers", 2))
+
+        # Identical pages (e.g. error pages, or iframes embedded on several pages) are only parsed once
+        self.parsed_pages = OrderedDict()
+        self.parsed_pages_lock = threading.Lock()
+
         done = 0
-        count = 0
+        failed = 0
+        self.dataset.update_status("Captured %i of %i possible URLs" % (done, num_urls))
+        try:
+            with ThreadPoolExecutor(max_workers=min(max_browsers, len(urls))) as executor:
+                futures = [executor.submit(self.collect_url, url, scrape_additional_subpages) for url in urls]
+                try:
+                    for future in as_completed(futures):
+                        if self.interrupted:
+                            raise ProcessorInterruptedException("Interrupted while scraping urls")
+
+                        for result in future.result():
+                            if not result['error']:
+                                done += 1
+                            else:
+                                # Failures are logged as they happen; only count them here
+                                failed += 1
+                            yield result
+
+                        self.dataset.update_progress(done / num_urls)
+                        self.dataset.update_status("Captured %i of %i possible URLs" % (done, num_urls))
+                finally:
+                    for future in futures:
+                        future.cancel()
+        finally:
+            for browser in self.extra_browsers:
+                browser.quit_selenium()
+
+        if failed:
+            self.dataset.update_status("Captured %i of %i possible URLs; %i URLs could not be collected (see dataset log "
+                                       "for details)" % (done, num_urls, failed))
+
+    def worker_browser(self):
+        """
+        Browser for the current worker thread
+
+        :return SeleniumWrapper:  Wrapper with a running driver
+        """
+        browser = getattr(self.worker_browsers, "browser", None)
+        if browser is None:
+            with self.worker_browsers_lock:
+                if not self.own_browser_in_use:
+                    self.own_browser_in_use = True
+                    browser = self
+                else:
+                    browser = SeleniumWrapper()
+                    self.extra_browsers.append(browser)
+            if browser is not self:
+                browser.start_selenium(eager=self.eager_selenium)
+                browser.set_page_load_timeout()
+            self.worker_browsers.browser = browser
+
+        return browser
+
+    def collect_url(self, url, scrape_additional_subpages):
+        """
+        Collect a url, and the requested number of subpages linked from it
+
+        Runs in a worker thread; the dataset log is written to, but status and progress are updated by get_items().
+
+        :param str url:  Url to collect
+        :param int scrape_additional_subpages:  Number of subpages to collect
+        :return list:  Results, one per collected (or failed) page
+        """
+        browser = self.worker_browser()
+        # Subpages must be on the same domain as the provided url (minus the first part, e.g. www.)
+        base_suffix = '.'.join(urlparse(url).netloc.split('.')[1:])
+        urls_to_scrape = deque([{'url':url, 'base_url':url, 'base_suffix': base_suffix, 'num_additional_subpages': scrape_additional_subpages, 'subpage_links':deque()}])
+        results = []
+
         while urls_to_scrape:
-            count += 1
             if self.interrupted:
-                raise ProcessorInterruptedException("Interrupted while scraping urls from the Web Archive")
-
-            self.dataset.update_progress(done / num_urls)
-            self.dataset.update_status("Captured %i of %i possible URLs" % (done, num_urls))
+                raise ProcessorInterruptedException("Interrupted while scraping urls")
 
             # Grab first url
-            url_obj = urls_to_scrape.pop(0)
+            url_obj = urls_to_scrape.popleft()
             url = url_obj['url']
             num_additional_subpages = url_obj['num_additional_subpages']
             result = {
@@ -111,17 +208,15 @@ class SearchWithSelenium(SeleniumSearch):
             while attempts < 2:
                 attempts += 1
                 try:
-                    scraped_page = self.simple_scrape_page(url, extract_links=True)
+                    scraped_page = browser.simple_scrape_page(url, extract_links=True)
                 except Exception as e:
                     self.dataset.log('Url %s unable to be scraped with error: %s' % (url, str(e)))
-                    self.restart_selenium()
+                    browser.restart_selenium()
                     result['error'] = 'SCRAPE ERROR:\n' + str(e) + '\n'
                     continue
 
-                # Check for results and collect text
-                if scraped_page:
-                    scraped_page['text'] = self.scrape_beautiful_text(scraped_page['page_source'])
-                else:
+                # Check for results
+                if not scraped_page:
                     # Hard Fail?
                     self.dataset.log('Hard fail; no page source on url: %s' % url)
                     continue
@@ -134,55 +229,61 @@ class SearchWithSelenium(SeleniumSearch):
                     break
                 else:
                     success = True
-                    scraped_urls.add(url)
+                    with self.scraped_urls_lock:
+                        self.scraped_urls.add(url)
                     break
 
             if success:
                 self.dataset.log('Collected: %s' % url)
-                done += 1
                 # Update result and yield it
                 result['final_url'] = scraped_page.get('final_url')
-                result['body'] = scraped_page.get('text')
+                # Text, links and iframes are extracted from a single parse, once the page is known not to be a 404
+                parsed_page = self.parse_page_source(scraped_page['page_source'], self.get_url_domain(url))
+                result['body'] = parsed_page['text']
                 result['subject'] = scraped_page.get('page_title')
                 result['html'] = scraped_page.get('page_source')
                 result['detected_404'] = scraped_page.get('detected_404')
-                result['timestamp'] = int(datetime.datetime.now().timestamp())
+                result['timestamp'] = int(time.time())
                 result['error'] = scraped_page.get('error') # This should be None...
                 result['selenium_links'] = scraped_page.get('links', [])
 
                 # Collect links from page source
-                domain = urlparse(url).scheme + '://' + urlparse(url).netloc
-                num_of_links, links = self.get_beautiful_links(scraped_page['page_source'], domain)
+                links = parsed_page['links']
                 result['scraped_links'] = links
 
                 # Scrape iframes as well
                 # These could be visible on the page, but are not in the page source
                 # TODO: Selenium can select iframes and pull the source that way; this may be better than the below method
-                iframe_links = self.get_beautiful_iframe_links(scraped_page['page_source'])
+                iframe_links = deque(parsed_page['iframe_links'])
+                # Page sources are joined once all iframes are collected rather than growing one (large) string
+                html_parts = [result['html']]
                 while iframe_links:
-                    link = iframe_links.pop(0)
+                    link = iframe_links.popleft()
                     if not link:
                         # Unable to extract link to iframe source
                         continue
-                    if not is_url(link):
+                    # Cheap check first; only iframes loaded over http(s) are collected
+                    if not link.startswith(('http://', 'https://')) or not is_url(link):
                         self.dataset.log(f"Skipping iframe page source found on {scraped_page.get('final_url')} due to malformed URL: {link}")
                         continue
 
                     result['embedded_iframes'].append(link)
                     try:
-                        iframe_page = self.simple_scrape_page(link, extract_links=True)
+                        iframe_page = browser.simple_scrape_page(link, extract_links=True)
                     except Exception as e:
                         self.dataset.log(f"Unable to collect iframe page source found on {scraped_page.get('final_url')}: {link} with error: {str(e)}")
                         continue
 
                     if iframe_page:
-                        result['body'] += ['\n'] + self.scrape_beautiful_text(iframe_page['page_source'])
-                        result['html'] += '\n' + iframe_page['page_source']
+                        parsed_iframe = self.parse_page_source(iframe_page['page_source'], self.get_url_domain(link))
+                        result['body'].append('\n')
+                        result['body'].extend(parsed_iframe['text'])
+                        html_parts.append(iframe_page['page_source'])
                         result['selenium_links'] += iframe_page.get('links', [])
                         # Collect links from page source
-                        domain = urlparse(link).scheme + '://' + urlparse(link).netloc
-                        num_of_links, links = self.get_beautiful_links(iframe_page['page_source'], domain)
+                        links = parsed_iframe['links']
                         result['scraped_links'] += links
+                result['html'] = '\n'.join(html_parts)
 
                 # Check if additional subpages need to be crawled
                 if num_additional_subpages > 0:
@@ -190,52 +291,86 @@ class SearchWithSelenium(SeleniumSearch):
                     if not url_obj['subpage_links']:
                         # If not, use this pages links collected above
                         # TODO could also use selenium detected links; results vary, check as they are also being stored
-                        # Randomize links (else we end up with mostly menu items at the top of webpages)
-                        random.shuffle(links)
+                        # Randomize links (else we end up with mostly menu items at the top of webpages); a shuffled
+                        # copy is used so the links stored in the result are not reordered or removed
+                        links = deque(random.sample(links, len(links)))
                     else:
                         links = url_obj['subpage_links']
 
-                    # Find the first link that has not been previously scraped
-                    while links:
-                        link = links.pop(0)
-                        if self.check_exclude_link(link.get('url'), scraped_urls, base_url='.'.join(urlparse(url_obj['base_url']).netloc.split('.')[1:])):
-                            # Add it to be scraped next
-                            urls_to_scrape.insert(0, {
-                                'url': link.get('url'),
-                                'base_url': url_obj['base_url'],
-                                'num_additional_subpages': num_additional_subpages - 1, # Make sure to request less additional pages
-                                'subpage_links':links,
-                            })
-                            break
-
-                yield result
+                    self.queue_next_subpage(urls_to_scrape, url_obj, links)
+
+                results.append(result)
 
             else:
                 # Page was not successfully scraped
                 # Still need subpages?
                 if num_additional_subpages > 0:
                     # Add the next one if it exists
-                    links = url_obj['subpage_links']
-                    while links:
-                        link = links.pop(0)
-                        if self.check_exclude_link(link.get('url'), scraped_urls, base_url='.'.join(urlparse(url_obj['base_url']).netloc.split('.')[1:])):
-                            # Add it to be scraped next
-                            urls_to_scrape.insert(0, {
-                                'url': link.get('url'),
-                                'base_url': url_obj['base_url'],
-                                'num_additional_subpages': num_additional_subpages - 1, # Make sure to request less additional pages
-                                'subpage_links':links,
-                            })
-                            break
+                    self.queue_next_subpage(urls_to_scrape, url_obj, url_obj['subpage_links'])
                 # Unsure if we should return ALL failures, but certainly the originally supplied urls
-                result['timestamp'] = int(datetime.datetime.now().timestamp())
+                result['timestamp'] = int(time.time())
                 if scraped_page:
                     result['error'] = scraped_page.get('error')
                 else:
                     # missing error...
                     result['error'] = 'Unable to scrape'
 
-                yield result
+                results.append(result)
+
+        return results
+
+    def parse_page_source(self, page_source, domain):
+        """
+        Extract text, links and iframe links from a page source, reusing the result if the same page source was
+        parsed before
+
+        Results are cached by a hash of the page source (and the domain) for the last `parsed_pages_cache_size` pages.
+        Copies of the lists are returned, as callers extend and shuffle them.
+
+        :param str page_source:  HTML to parse
+        :param str domain:  Domain used to fix partial links
+        :return dict:  Dictionary with text, num_links, links and iframe_links (see parse_beautiful_page)
+        """
+        key = (hashlib.blake2b(page_source.encode(), digest_size=16).digest(), domain)
+        with self.parsed_pages_lock:
+            parsed = self.parsed_pages.get(key)
+            if parsed is not None:
+                self.parsed_pages.move_to_end(key)
+
+        if parsed is None:
+            parsed = self.parse_beautiful_page(page_source, domain)
+            with self.parsed_pages_lock:
+                self.parsed_pages[key] = parsed
+                if len(self.parsed_pages) > self.parsed_pages_cache_size:
+                    self.parsed_pages.popitem(last=False)
+
+        return {key: list(value) if isinstance(value, list) else value for key, value in parsed.items()}
+
+    def queue_next_subpage(self, urls_to_scrape, url_obj, links):
+        """
+        Queue the first link that has not been previously scraped to be scraped next
+
+        The link is claimed straight away so that other workers do not pick it as well.
+
+        :param deque urls_to_scrape:  Urls still to be scraped by this worker
+        :param dict url_obj:  Url the links were found on
+        :param deque links:  Candidate links; links that are checked are removed
+        """
+        with self.scraped_urls_lock:
+            while links:
+                link = links.popleft()
+                if self.check_exclude_link(link.get('url'), self.scraped_urls, base_url=url_obj['base_suffix']):
+                    self.scraped_urls.add(link.get('url'))
+                    # Add it to be scraped next
+                    urls_to_scrape.appendleft({
+                        'url': link.get('url'),
+                        'base_url': url_obj['base_url'],
+                        'base_suffix': url_obj['base_suffix'],
+                        'num_additional_subpages': url_obj['num_additional_subpages'] - 1, # Make sure to request less additional pages
+                        'subpage_links':links,
+                    })
+                    break
+
     @staticmethod
     def map_item(page_result):
         """
@@ -254,7 +389,8 @@ class SearchWithSelenium(SeleniumSearch):
         # Convert list of link objects to comma seperated urls
         page_result['scraped_links'] = ','.join([link.get('url') for link in page_result.get('scraped_links')]) if page_result.get('scraped_links') else ''
         # Convert list of links to comma seperated urls
-        page_result['selenium_links'] = ','.join(map(str,page_result.get('selenium_links'))) if type(page_result.get('selenium_links')) == list else page_result.get('selenium_links', '')
+        selenium_links = page_result.get('selenium_links', '')
+        page_result['selenium_links'] = ','.join(selenium_links) if isinstance(selenium_links, list) else selenium_links
 
         return MappedItem(page_result)
 
@@ -277,7 +413,7 @@ class SearchWithSelenium(SeleniumSearch):
         if not query.get("query", None):
             raise QueryParametersException("Please provide a List of urls.")
         urls = [url.strip() for url in query.get("query", "").replace("\n", ",").split(',')]
-        preprocessed_urls = [url for url in urls if is_url(url)]
+        preprocessed_urls = [url for url in dict.fromkeys(urls) if is_url(url)]
         if not preprocessed_urls:
             raise QueryParametersException("No Urls detected!")
 
@@ -7,9 +7,11 @@ from urllib.parse import urlparse
 import datetime
 import requests
 import random
+import threading
 import time
 from ural import is_url
 from dateutil.relativedelta import relativedelta
+from selenium.common.exceptions import TimeoutException, InvalidSessionIdException
 
 from extensions.web_studies.selenium_scraper import SeleniumSearch
 from common.lib.exceptions import QueryParametersException, ProcessorInterruptedException, ProcessorException
@@ -36,6 +38,10 @@ class SearchWebArchiveWithSelenium(SeleniumSearch):
 
     urls_to_exclude = ['mailto:', 'javascript', 'archive.org/about', 'archive.org/account/']
 
+    # HTTP requests share one session so connections to the Web Archive are kept alive
+    _http_session = None
+    _http_session_lock = threading.Lock()
+
     @classmethod
     def get_options(cls, parent_dataset=None, user=None):
         options = {
@@ -157,22 +163,27 @@ class SearchWebArchiveWithSelenium(SeleniumSearch):
                 attempts += 1
                 try:
                     scraped_page = self.simple_scrape_page(url, extract_links=True)
+                    self.consecutive_errors = 0
                 except Exception as e:
                     self.dataset.log('Url %s unable to be scraped with error: %s' % (url, str(e)))
-                    self.restart_selenium()
                     result['error'] += 'SCAPE ERROR:\n' + str(e) + '\n'
+                    # Keep using the same browser unless it is gone or keeps failing; restarting is slow
+                    self.consecutive_errors += 1
+                    if isinstance(e, InvalidSessionIdException) or (not isinstance(e, TimeoutException) and self.consecutive_errors > self.num_consecutive_errors_before_restart):
+                        self.restart_selenium()
                     continue
 
-                if scraped_page:
-                    scraped_page['text'] = self.scrape_beautiful_text(scraped_page['page_source'])
-                else:
+                if not scraped_page:
                     # Hard Fail?
                     self.dataset.log('Hard fail; no page source on url: %s' % url)
                     result['error'] += 'SCAPE ERROR:\n No page source on url; retrying\n'
                     continue
 
+                # Text and links are taken from a single parse of the page source
+                scraped_page['parsed'] = self.parse_beautiful_page(scraped_page['page_source'], self.get_url_domain(url))
+
                 # Redirects require waiting on Internet Archive
-                if any([any([redirect_text in text for redirect_text in self.redirect_text]) for text in scraped_page['text']]):
+                if any([any([redirect_text in text for redirect_text in self.redirect_text]) for text in scraped_page['parsed']['text']]):
                     # Update last_scraped_url for movement check
                     self.last_scraped_url = self.driver.current_url
                     self.dataset.log('Redirect url: %s' % url)
@@ -182,9 +193,9 @@ class SearchWebArchiveWithSelenium(SeleniumSearch):
                         while time_to_wait > 0:
                             if self.check_for_movement():
                                 time.sleep(5)
-                                scraped_page = self.collect_results(url)
+                                scraped_page = self.collect_results(url, extract_links=True)
                                 if scraped_page:
-                                    scraped_page['text'] = self.scrape_beautiful_text(scraped_page['page_source'])
+                                    scraped_page['parsed'] = self.parse_beautiful_page(scraped_page['page_source'], self.get_url_domain(url))
                                     break
                                 else:
                                     raise Exception('No page source on url: %s' % url)
@@ -199,7 +210,7 @@ class SearchWebArchiveWithSelenium(SeleniumSearch):
                         result['error'] += redirect_error
                         break
 
-                if any([any([bad_response in text for bad_response in self.bad_response_text]) for text in scraped_page['text']]):
+                if any([any([bad_response in text for bad_response in self.bad_response_text]) for text in scraped_page['parsed']['text']]):
                     # Bad response from Internet Archive
                     bad_internet_archive_request = 'Web Archive bad request detected on url: %s\nTrying again...' % url
                     self.dataset.log(bad_internet_archive_request)
@@ -220,18 +231,17 @@ class SearchWebArchiveWithSelenium(SeleniumSearch):
             if success:
                 self.dataset.log('Collected: %s' % url)
                 done += 1
+                parsed_page = scraped_page['parsed']
+                links = parsed_page['links']
+
                 result['final_url'] = scraped_page.get('final_url')
-                result['body'] = scraped_page.get('text')
+                result['body'] = parsed_page['text']
                 result['subject'] = scraped_page.get('page_title')
                 result['html'] = scraped_page.get('page_source')
                 result['detected_404'] = scraped_page.get('detected_404')
                 result['timestamp'] = int(datetime.datetime.now().timestamp())
                 result['error'] += scraped_page.get('error', '') if scraped_page.get('error') else ''
                 result['selenium_links'] = scraped_page.get('links') if scraped_page.get('links') else scraped_page.get('collect_links_error')
-
-                # Collect links from page source
-                domain = urlparse(url).scheme + '://' + urlparse(url).netloc
-                num_of_links, links = self.get_beautiful_links(scraped_page['page_source'], domain)
                 result['scraped_links'] = links
 
                 # Check is additional subpages need to be scraped
@@ -297,30 +307,43 @@ class SearchWebArchiveWithSelenium(SeleniumSearch):
                 yield result
 
 
+    @classmethod
+    def get_http_session(cls):
+        """
+        Get the requests session used for HTTP requests, creating it on first use
+
+        :return requests.Session:
+        """
+        if cls._http_session is None:
+            with cls._http_session_lock:
+                if cls._http_session is None:
+                    cls._http_session = requests.Session()
+        return cls._http_session
+
     def request_get_w_error_handling(self, url, retries=3, **kwargs):
         """
-        Try requests.get() and logging error in dataset.log().
+        Try a GET request via the shared session and logging error in dataset.log().
 
-        Retries ConnectionError three times by default
+        Retries ConnectionError three times by default, waiting exponentially
+        longer (with some random jitter) before each new attempt
         """
-        try:
-            response = requests.get(url, **kwargs)
-        except requests.exceptions.Timeout as e:
-            self.dataset.log("Error: Timeout on url %s: %s" % (url, str(e)))
-            raise e
-        except requests.exceptions.SSLError as e:
-            self.dataset.log("Error: SSLError on url %s: %s" % (url, str(e)))
-            raise e
-        except requests.exceptions.TooManyRedirects as e:
-            self.dataset.log("Error: TooManyRedirects on url %s: %s" % (url, str(e)))
-            raise e
-        except requests.exceptions.ConnectionError as e:
-            if retries > 0:
-                response = self.request_get_w_error_handling(url, retries=retries - 1, **kwargs)
-            else:
-                self.dataset.log("Error: ConnectionError on url %s: %s" % (url, str(e)))
+        for attempt in range(retries + 1):
+            try:
+                return self.get_http_session().get(url, **kwargs)
+            except requests.exceptions.Timeout as e:
+                self.dataset.log("Error: Timeout on url %s: %s" % (url, str(e)))
+                raise e
+            except requests.exceptions.SSLError as e:
+                self.dataset.log("Error: SSLError on url %s: %s" % (url, str(e)))
+                raise e
+            except requests.exceptions.TooManyRedirects as e:
+                self.dataset.log("Error: TooManyRedirects on url %s: %s" % (url, str(e)))
                 raise e
-        return response
+            except requests.exceptions.ConnectionError as e:
+                if attempt >= retries:
+                    self.dataset.log("Error: ConnectionError on url %s: %s" % (url, str(e)))
+                    raise e
+                time.sleep(min(30, 2 ** attempt) * (1 + random.uniform(0, 0.5)))
 
     @staticmethod
     def map_item(page_result):
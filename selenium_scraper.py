@@ -3,9 +3,23 @@ import time
 import shutil
 import abc
 import os
-from urllib.parse import urljoin
+import re
+import queue
+import atexit
+import threading
+import functools
+from contextlib import contextmanager
+from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
 from bs4.element import Comment
+try:
+    # lxml builds soup trees several times faster than Python's own html.parser
+    import lxml
+    default_soup_parser = "lxml"
+except ImportError:
+    default_soup_parser = "html.parser"
+
+iframe_tag = re.compile(r"<iframe", re.IGNORECASE)
 
 from backend.lib.search import Search
 from common.lib.exceptions import ProcessorException
@@ -47,6 +61,11 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
     last_scraped_url = None
     browser = None
     eager_selenium = False
+    # Do not load images, web fonts and analytics; for scrapers that only read text and links
+    disable_media = False
+    # URL patterns blocked in Chrome if disable_media is set (Firefox uses preferences and tracking protection instead)
+    blocked_media_urls = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.woff", "*.woff2", "*.ttf",
+                          "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*"]
 
     consecutive_errors = 0
     num_consecutive_errors_before_restart = 3
@@ -150,19 +169,37 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
             }
 
         if extract_links:
-            result['links'] = self.collect_links()
+            try:
+                result['links'] = self.collect_links()
+            except WebDriverException as e:
+                # The page source is still usable without the links
+                result['collect_links_error'] = 'Unable to collect links: %s' % e.msg
 
         return result
 
     def collect_links(self):
         """
+        Collect the href of every link on the current page, as resolved by the browser
 
+        Uses a single script call; fetching the elements and then each of their attributes takes a round trip to the
+        browser per link. SVG links have no string href property, so their href attribute is resolved instead (or
+        returned as is if it is not a valid URL).
         """
         if self.driver is None:
             raise ProcessorException('Selenium Drive not yet started: Cannot collect links')
 
-        elems = self.driver.find_elements(By.XPATH, "//a[@href]")
-        return [elem.get_attribute("href") for elem in elems]
+        return self.driver.execute_script("""
+        return Array.from(document.querySelectorAll('a[href]'), link => {
+            if (typeof link.href === 'string') {
+                return link.href;
+            }
+            try {
+                return new URL(link.getAttribute('href'), document.baseURI).href;
+            } catch (e) {
+                return link.getAttribute('href');
+            }
+        });
+        """)
 
     @staticmethod
     def check_exclude_link(link, previously_used_links, base_url=None, bad_url_list=None):
@@ -182,8 +219,7 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
         if bad_url_list is None:
             bad_url_list = ['mailto:', 'javascript']
 
-        if link and link not in previously_used_links and \
-            not any([bad_url in link[:len(bad_url)] for bad_url in bad_url_list]):
+        if link and link not in previously_used_links and not link.startswith(tuple(bad_url_list)):
                 if base_url is None:
                     return True
                 elif base_url in link:
@@ -213,6 +249,11 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
             profile = webdriver.FirefoxProfile(config.get("PATH_ROOT").joinpath("config/"))
             profile.set_preference("dom.webdriver.enabled", False)
             profile.set_preference('useAutomationExtension', False)
+            if self.disable_media:
+                profile.set_preference("permissions.default.image", 2)
+                profile.set_preference("browser.display.use_document_fonts", 0)
+                # Blocks known analytics and advertising trackers
+                profile.set_preference("privacy.trackingprotection.enabled", True)
             profile.update_preferences()
             desired = DesiredCapabilities.FIREFOX
         else:
@@ -229,6 +270,16 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
         if self.eager_selenium:
             options.set_capability("pageLoadStrategy", "eager")
 
+        if self.browser == 'chrome':
+            # No extensions are used with Chrome; background networking and throttling only slow headless scraping
+            options.add_argument("--disable-extensions")
+            options.add_argument("--disable-background-networking")
+            options.add_argument("--disable-renderer-backgrounding")
+
+        if self.disable_media and self.browser == 'chrome':
+            options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+            options.add_argument("--blink-settings=imagesEnabled=false")
+
         try:
             if self.browser == 'chrome':
                 self.driver = webdriver.Chrome(executable_path=config.get('selenium.selenium_executable_path'), options=options)
@@ -249,6 +300,11 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
                 raise ProcessorException('Webdriver not installed or path to executable incorrect (%s)' % str(e))
             else:
                 raise ProcessorException("Could not connect to browser (%s)." % str(e))
+        if self.disable_media and self.browser == 'chrome':
+            # Block requests for images, fonts and common analytics outright
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.blocked_media_urls})
+
         # Test adding a script to remove webdriver detection
         self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         self.selenium_log.info(f"Selenium started with browser PID: {self.driver.service.process.pid}")
@@ -334,6 +390,36 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
 
         return True
 
+    def wait_for_page_load(self, max_time=60):
+        """
+        Wait for page to finish loading. Returns True if loaded, False if not.
+
+        Like check_page_is_loaded(), but the browser waits for the load event itself so only a single webdriver call
+        is made instead of polling document.readyState.
+        """
+        # Restored afterwards; drivers may be shared (e.g. via SeleniumDriverPool) and used for other async scripts
+        previous_script_timeout = self.driver.timeouts.script
+        self.driver.set_script_timeout(max_time + 5)
+        script = """
+        const [maxTime, callback] = arguments;
+        if (document.readyState === "complete") {
+            return callback(true);
+        }
+        window.addEventListener("load", () => callback(true));
+        setTimeout(() => callback(false), maxTime * 1000);
+        """
+        try:
+            try:
+                return self.driver.execute_async_script(script, max_time)
+            except UnexpectedAlertPresentException:
+                # attempt to dismiss random alert
+                self.dismiss_alert()
+                return self.driver.execute_async_script(script, max_time)
+        except (TimeoutException, JavascriptException):
+            return False
+        finally:
+            self.driver.set_script_timeout(previous_script_timeout)
+
     def reset_current_page(self):
         """
         It may be desirable to "reset" the current page, for example in conjunction with self.check_for_movement(),
@@ -420,9 +506,23 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
         # Return to previous size (might not be necessary)
         self.driver.set_window_size(original_size['width'], original_size['height'])
 
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def get_url_domain(url):
+        """
+        Scheme and network location of a url (e.g. https://www.example.com), which can be used to fix partial links
+
+        Cached, as the same pages (and embedded iframes) tend to come up repeatedly when scraping.
+
+        :param str url:  Url
+        :return str:  Domain
+        """
+        parsed_url = urlparse(url)
+        return parsed_url.scheme + '://' + parsed_url.netloc
+
     # Some BeautifulSoup helper functions
     @staticmethod
-    def scrape_beautiful_text(page_source, beautiful_soup_parser='html.parser'):
+    def scrape_beautiful_text(page_source, beautiful_soup_parser=default_soup_parser):
         """takes page source and uses BeautifulSoup to extract a list of all visible text items on page"""
 
         # Couple of helper functions
@@ -448,8 +548,8 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
             """Check for any alpha"""
             return any([c.isalpha() for c in string])
 
-        # Create soup
-        soup = BeautifulSoup(page_source, beautiful_soup_parser)
+        # Create soup (unless one was passed)
+        soup = page_source if isinstance(page_source, BeautifulSoup) else BeautifulSoup(page_source, beautiful_soup_parser)
 
         # I may be able to simplify this... just if t?
         text = [t.strip() for t in text_from_html(soup) if t.strip()]
@@ -463,15 +563,16 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
             return text
 
     @staticmethod
-    def get_beautiful_links(page_source, domain, beautiful_soup_parser='html.parser'):
+    def get_beautiful_links(page_source, domain, beautiful_soup_parser=default_soup_parser):
         """
         takes page_source and creates BeautifulSoup entity and url that was scraped, finds all links,
         and returns the number of links and a list of all links in tuple of shown text, fixed link,
         and original link.
 
-        Uses domain to attempt to fix links that are partial.
+        Uses domain to attempt to fix links that are partial. page_source can also be an already created
+        BeautifulSoup entity.
         """
-        soup = BeautifulSoup(page_source, beautiful_soup_parser)
+        soup = page_source if isinstance(page_source, BeautifulSoup) else BeautifulSoup(page_source, beautiful_soup_parser)
         url_count = 0
         all_links= soup.findAll('a')
         links_to_return = []
@@ -500,7 +601,7 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
         return url_count, links_to_return
 
     @staticmethod
-    def get_beautiful_iframe_links(page_source, beautiful_soup_parser='html.parser'):
+    def get_beautiful_iframe_links(page_source, beautiful_soup_parser=default_soup_parser):
         """
         takes page_source and creates BeautifulSoup entity, then looks for iframes
         and gets their src link. This could perhaps be more robust. Selenium can
@@ -510,9 +611,11 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
         You could then either use requests of selenium to scrape these links.
         TODO: is it possible/desirable to insert the html source code back into
         the original url?
+
+        page_source can also be an already created BeautifulSoup entity.
         """
         iframe_links = []
-        soup = BeautifulSoup(page_source, beautiful_soup_parser)
+        soup = page_source if isinstance(page_source, BeautifulSoup) else BeautifulSoup(page_source, beautiful_soup_parser)
         iframes = soup.findAll('iframe')
         if iframes:
             for iframe in iframes:
@@ -529,9 +632,38 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
                     pass
         return iframe_links
 
-    def scroll_down_page_to_load(self, max_time=None):
+    @classmethod
+    def parse_beautiful_page(cls, page_source, domain, beautiful_soup_parser=default_soup_parser):
+        """
+        Creates one BeautifulSoup entity from page_source and extracts the visible text, links and iframe links from
+        it; the same as calling scrape_beautiful_text, get_beautiful_links and get_beautiful_iframe_links, but the page
+        is only parsed once.
+
+        :param str page_source:  HTML to parse
+        :param str domain:  Domain used to fix partial links
+        :param str beautiful_soup_parser:  Parser used by BeautifulSoup
+        :return dict:  Dictionary with text, num_links, links and iframe_links
+        """
+        soup = BeautifulSoup(page_source, beautiful_soup_parser)
+        num_links, links = cls.get_beautiful_links(soup, domain)
+        return {
+            "text": cls.scrape_beautiful_text(soup),
+            "num_links": num_links,
+            "links": links,
+            # Most pages have no iframes; a plain text search is much cheaper than walking the soup for them
+            "iframe_links": cls.get_beautiful_iframe_links(soup) if iframe_tag.search(page_source) else [],
+        }
+
+    def scroll_down_page_to_load(self, max_time=None, target_count=None, locator=None):
         """
         Scroll down page until it is fully loaded. Returns top of window at end.
+
+        If target_count and locator are given, stops as soon as at least target_count elements matching locator are
+        on the page.
+
+        :param int max_time:  Maximum time to scroll in seconds
+        :param int target_count:  Stop once this many elements are found
+        :param tuple locator:  Locator of elements to count, e.g. (By.TAG_NAME, "article")
         """
 
         def _scroll_to_top():
@@ -553,6 +685,12 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
                     _scroll_to_top()
                     return last_bottom
 
+            if target_count is not None and locator is not None:
+                if len(self.driver.find_elements(*locator)) >= target_count:
+                    # Enough has been loaded
+                    _scroll_to_top()
+                    return last_bottom
+
             # Scroll down
             try:
                 self.driver.execute_script("window.scrollTo(0, window.scrollY + window.innerHeight);")
@@ -580,6 +718,42 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
             last_bottom = current_bottom
             time.sleep(.2)
 
+    def wait_for_selector(self, css_selector, max_time=15):
+        """
+        Wait until an element matching css_selector is on the page. Returns True if found, False if not.
+
+        Uses a MutationObserver in the browser that resolves as soon as the element is added, instead of polling via
+        the webdriver or scrolling the page.
+
+        :param str css_selector:  CSS selector of element to wait for
+        :param int max_time:  Maximum time to wait in seconds
+        """
+        # Restored afterwards, as in wait_for_page_load()
+        previous_script_timeout = self.driver.timeouts.script
+        self.driver.set_script_timeout(max_time + 5)
+        try:
+            return self.driver.execute_async_script("""
+            const [selector, maxTime, callback] = arguments;
+            if (document.querySelector(selector)) {
+                return callback(true);
+            }
+            const observer = new MutationObserver(() => {
+                if (document.querySelector(selector)) {
+                    observer.disconnect();
+                    callback(true);
+                }
+            });
+            observer.observe(document.body, {childList: true, subtree: true});
+            setTimeout(() => {
+                observer.disconnect();
+                callback(false);
+            }, maxTime * 1000);
+            """, css_selector, max_time)
+        except (TimeoutException, JavascriptException):
+            return False
+        finally:
+            self.driver.set_script_timeout(previous_script_timeout)
+
     def kill_browser(self, browser):
         self.selenium_log.info(f"4CAT is killing {browser} with PID: {self.driver.service.process.pid}")
         try:
@@ -634,6 +808,195 @@ class SeleniumWrapper(metaclass=abc.ABCMeta):
         return True
 
 
+class RateLimiter:
+    """
+    Token bucket rate limiter
+
+    Allows bursts of up to `capacity` requests and refills at `rate` requests per second. Thread safe.
+    """
+    def __init__(self, rate=8, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until a request may be made
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.rate)
+                self.last_refill = time.monotonic()
+                self.tokens = 0
+            else:
+                self.tokens -= 1
+
+
+class SeleniumDriverPool:
+    """
+    Pool of running Selenium webdrivers
+
+    Starting a browser takes a couple of seconds; workers that run often (or several at a time) can borrow an already
+    running driver from the pool instead. Drivers are reset (cookies deleted and blank page loaded) before they are
+    lent out and are quit after `max_uses` uses, after being idle for `max_idle` seconds, if they no longer respond,
+    or if the pool already holds `size` idle drivers. All drivers in a pool are started with the same `eager` and
+    `disable_media` settings.
+
+    Idle drivers are reaped in the background once they pass `max_idle`, and any that are left are quit when the
+    process exits, so no browsers linger between (or after) jobs.
+    """
+    def __init__(self, size=2, max_uses=20, max_idle=900, eager=False, disable_media=False):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self.eager = eager
+        self.disable_media = disable_media
+        # Idle drivers as (driver, browser, uses, idle since) tuples
+        self.idle = queue.Queue()
+        self.reaper = None
+        self.reaper_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def borrow(self, wrapper):
+        """
+        Lend a running driver to a SeleniumWrapper, starting a new one if no usable idle driver is available
+
+        :param SeleniumWrapper wrapper:  Wrapper that will use the driver
+        """
+        # Also applies if the wrapper restarts its driver
+        wrapper.eager_selenium = self.eager
+        wrapper.disable_media = self.disable_media
+        while True:
+            try:
+                driver, browser, uses, idle_since = self.idle.get_nowait()
+            except queue.Empty:
+                break
+
+            if time.time() - idle_since > self.max_idle:
+                self._quit(driver)
+                continue
+
+            try:
+                driver.delete_all_cookies()
+                driver.get('data:,')
+            except Exception as e:
+                # Driver or browser no longer usable
+                SeleniumWrapper.selenium_log.warning(f"Discarding unresponsive Selenium driver from pool: {e}")
+                self._quit(driver)
+                continue
+
+            wrapper.driver = driver
+            wrapper.browser = browser
+            wrapper.pool_uses = uses + 1
+            wrapper.last_scraped_url = driver.current_url
+            return
+
+        # Nothing (usable) available
+        SeleniumWrapper.start_selenium(wrapper)
+        wrapper.pool_uses = 1
+
+    def give_back(self, wrapper, discard=False):
+        """
+        Return a driver to the pool
+
+        :param SeleniumWrapper wrapper:  Wrapper that borrowed the driver; its driver is unset
+        :param bool discard:  Quit the driver instead of making it available again
+        """
+        driver = wrapper.driver
+        if driver is None:
+            return
+        wrapper.driver = None
+
+        if discard or getattr(wrapper, "pool_uses", self.max_uses) >= self.max_uses or self.idle.qsize() >= self.size:
+            self._quit(driver)
+        else:
+            self.idle.put((driver, wrapper.browser, wrapper.pool_uses, time.time()))
+            self._schedule_reaper()
+
+    def reap(self):
+        """
+        Quit idle drivers that have not been used for `max_idle` seconds
+
+        Runs on a timer while the pool holds idle drivers.
+        """
+        with self.reaper_lock:
+            self.reaper = None
+
+        keep = []
+        while True:
+            try:
+                idle_driver = self.idle.get_nowait()
+            except queue.Empty:
+                break
+
+            if time.time() - idle_driver[3] > self.max_idle:
+                self._quit(idle_driver[0])
+            else:
+                keep.append(idle_driver)
+
+        for idle_driver in keep:
+            self.idle.put(idle_driver)
+
+        if keep:
+            # Check again when the longest idle driver is due
+            self._schedule_reaper(self.max_idle - (time.time() - min(idle_driver[3] for idle_driver in keep)) + 1)
+
+    def close(self):
+        """
+        Quit all idle drivers and stop reaping
+
+        Registered to run at exit; drivers that are lent out are quit by their borrower.
+        """
+        with self.reaper_lock:
+            if self.reaper is not None:
+                self.reaper.cancel()
+                self.reaper = None
+
+        while True:
+            try:
+                driver, browser, uses, idle_since = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
+
+    def _schedule_reaper(self, delay=None):
+        with self.reaper_lock:
+            if self.reaper is None:
+                self.reaper = threading.Timer(max(1, delay if delay is not None else self.max_idle + 1), self.reap)
+                self.reaper.daemon = True
+                self.reaper.start()
+
+    @contextmanager
+    def acquire(self):
+        """
+        Borrow a driver for the duration of a `with` block
+
+        The driver is discarded rather than returned to the pool if an exception is raised within the block.
+
+        :return SeleniumWrapper:  Wrapper with a running driver
+        """
+        wrapper = SeleniumWrapper()
+        self.borrow(wrapper)
+        try:
+            yield wrapper
+        except Exception:
+            self.give_back(wrapper, discard=True)
+            raise
+        self.give_back(wrapper)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            SeleniumWrapper.selenium_log.error(e)
+
+
 class SeleniumSearch(SeleniumWrapper, Search, metaclass=abc.ABCMeta):
     """
     Selenium Scraper class